@@ -32,6 +32,17 @@ target_metadata = Base.metadata
 # ... etc.
 
 
+def include_object(object, name, type_, reflected, compare_to) -> bool:
+    """Leave out of autogenerate indexes created for other dialects only
+
+    Autogenerate doesn't honor Index.ddl_if(), like for PostgreSQL trigram
+    indexes, so it would want to create them on SQLite."""
+    ddl_if = getattr(object, "_ddl_if", None) if type_ == "index" else None
+    if ddl_if is None or ddl_if.dialect is None:
+        return True
+    return context.get_context().dialect.name == ddl_if.dialect
+
+
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode.
 
@@ -51,6 +62,7 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        render_as_batch=url.get_backend_name() == "sqlite",
     )
 
     with context.begin_transaction():
@@ -72,7 +84,17 @@ def run_migrations_online() -> None:
     connectable = get_admin_engine()
 
     with connectable.connect() as connection:
-        context.configure(connection=connection, target_metadata=target_metadata)
+        if connection.dialect.name == "sqlite":
+            # Batch mode copies tables, referenced ones can't be dropped meanwhile
+            connection.exec_driver_sql("PRAGMA foreign_keys=OFF")
+            connection.commit()
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            include_object=include_object,
+            # SQLite's ALTER TABLE is limited, tables are copied instead
+            render_as_batch=connection.dialect.name == "sqlite",
+        )
 
         with context.begin_transaction():
             context.run_migrations()
@@ -0,0 +1,56 @@
+"""added filter and foreign key indexes
+
+Revision ID: 045f3f58310a
+Revises: c108bb9f6e00
+Create Date: 2026-10-18 09:12:41.204518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '045f3f58310a'
+down_revision: Union[str, None] = 'c108bb9f6e00'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# employee.username is already indexed by its unique constraint.
+INDEXES = [
+    ('ix_client_commercial_employee_id', 'client', ['commercial_employee_id'], None),
+    ('ix_contract_client_id', 'contract', ['client_id'], None),
+    ('ix_contract_created_date', 'contract', ['created_date'], None),
+    ('ix_contract_not_signed_created_date', 'contract', ['created_date'], "status != 'signed'"),
+    ('ix_event_contrat_id', 'event', ['contrat_id'], None),
+    ('ix_event_support_employee_id', 'event', ['support_employee_id'], None),
+    ('ix_event_no_support_id', 'event', ['id'], 'support_employee_id IS NULL'),
+]
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction block
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in INDEXES:
+            op.create_index(
+                name,
+                table,
+                columns,
+                unique=False,
+                postgresql_where=sa.text(where) if where else None,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(
+                name,
+                table_name=table,
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
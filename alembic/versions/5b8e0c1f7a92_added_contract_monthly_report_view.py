@@ -0,0 +1,61 @@
+"""added contract monthly report view
+
+Revision ID: 5b8e0c1f7a92
+Revises: d2f5653c5530
+Create Date: 2026-10-18 14:27:53.861042
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b8e0c1f7a92'
+down_revision: Union[str, None] = 'd2f5653c5530'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Same columns as controllers.report.monthly_aggregates()
+VIEW_QUERY = """
+SELECT
+    client.commercial_employee_id,
+    CAST(EXTRACT(YEAR FROM contract.created_date) AS INTEGER) AS year,
+    CAST(EXTRACT(MONTH FROM contract.created_date) AS INTEGER) AS month,
+    COUNT(contract.id) AS contract_count,
+    COUNT(contract.id) FILTER (WHERE contract.status = 'signed') AS signed_count,
+    COALESCE(SUM(contract.total_amount) FILTER (WHERE contract.status = 'signed'), 0)
+        AS signed_revenue,
+    COALESCE(SUM(contract.amount_to_pay) FILTER (WHERE contract.status = 'signed'), 0)
+        AS outstanding_amount
+FROM contract
+JOIN client ON client.id = contract.client_id
+GROUP BY 1, 2, 3
+"""
+
+
+def is_postgresql() -> bool:
+    # Materialized views are PostgreSQL only, reports are computed live elsewhere
+    return op.get_context().dialect.name == 'postgresql'
+
+
+def upgrade() -> None:
+    if not is_postgresql():
+        return
+    op.execute(f"CREATE MATERIALIZED VIEW contract_monthly_report AS {VIEW_QUERY} WITH DATA")
+    # REFRESH MATERIALIZED VIEW CONCURRENTLY requires a unique index
+    op.create_index(
+        'ux_contract_monthly_report',
+        'contract_monthly_report',
+        ['commercial_employee_id', 'year', 'month'],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    if not is_postgresql():
+        return
+    op.drop_index('ux_contract_monthly_report', table_name='contract_monthly_report')
+    op.execute("DROP MATERIALIZED VIEW contract_monthly_report")
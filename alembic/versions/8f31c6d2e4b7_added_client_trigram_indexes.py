@@ -0,0 +1,59 @@
+"""added client trigram indexes
+
+Revision ID: 8f31c6d2e4b7
+Revises: 5b8e0c1f7a92
+Create Date: 2026-10-18 15:06:19.447285
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8f31c6d2e4b7'
+down_revision: Union[str, None] = '5b8e0c1f7a92'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+COLUMNS = ['firstname', 'lastname', 'society_name', 'email']
+
+
+def is_postgresql() -> bool:
+    # pg_trgm indexes are PostgreSQL only
+    return op.get_context().dialect.name == 'postgresql'
+
+
+def upgrade() -> None:
+    if not is_postgresql():
+        return
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction block
+    with op.get_context().autocommit_block():
+        for column in COLUMNS:
+            op.create_index(
+                f'ix_client_{column}_trgm',
+                'client',
+                [column],
+                unique=False,
+                postgresql_using='gin',
+                postgresql_ops={column: 'gin_trgm_ops'},
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    if not is_postgresql():
+        return
+    with op.get_context().autocommit_block():
+        for column in reversed(COLUMNS):
+            op.drop_index(
+                f'ix_client_{column}_trgm',
+                table_name='client',
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
+    # The pg_trgm extension is kept, other objects may depend on it
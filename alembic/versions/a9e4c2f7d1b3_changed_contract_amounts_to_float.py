@@ -0,0 +1,69 @@
+"""changed contract amounts to float
+
+Revision ID: a9e4c2f7d1b3
+Revises: f3b7d2a9c5e1
+Create Date: 2026-10-18 22:41:07.193528
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9e4c2f7d1b3'
+down_revision: Union[str, None] = 'f3b7d2a9c5e1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# As created by migration 5b8e0c1f7a92
+VIEW_QUERY = """
+SELECT
+    client.commercial_employee_id,
+    CAST(EXTRACT(YEAR FROM contract.created_date) AS INTEGER) AS year,
+    CAST(EXTRACT(MONTH FROM contract.created_date) AS INTEGER) AS month,
+    COUNT(contract.id) AS contract_count,
+    COUNT(contract.id) FILTER (WHERE contract.status = 'signed') AS signed_count,
+    COALESCE(SUM(contract.total_amount) FILTER (WHERE contract.status = 'signed'), 0)
+        AS signed_revenue,
+    COALESCE(SUM(contract.amount_to_pay) FILTER (WHERE contract.status = 'signed'), 0)
+        AS outstanding_amount
+FROM contract
+JOIN client ON client.id = contract.client_id
+GROUP BY 1, 2, 3
+"""
+
+
+def is_postgresql() -> bool:
+    # Only PostgreSQL has the materialized view reading the amounts
+    return op.get_context().dialect.name == 'postgresql'
+
+
+def alter_amount_types(existing_type, type_) -> None:
+    # Columns read by a view can't change type: it is dropped meanwhile
+    if is_postgresql():
+        op.drop_index('ux_contract_monthly_report', table_name='contract_monthly_report')
+        op.execute("DROP MATERIALIZED VIEW contract_monthly_report")
+    with op.batch_alter_table('contract') as batch_op:
+        for name in ('total_amount', 'amount_to_pay'):
+            batch_op.alter_column(
+                name, existing_type=existing_type, type_=type_, existing_nullable=True
+            )
+    if is_postgresql():
+        op.execute(f"CREATE MATERIALIZED VIEW contract_monthly_report AS {VIEW_QUERY} WITH DATA")
+        op.create_index(
+            'ux_contract_monthly_report',
+            'contract_monthly_report',
+            ['commercial_employee_id', 'year', 'month'],
+            unique=True,
+        )
+
+
+def upgrade() -> None:
+    alter_amount_types(sa.Integer(), sa.Float())
+
+
+def downgrade() -> None:
+    alter_amount_types(sa.Float(), sa.Integer())
@@ -0,0 +1,55 @@
+"""added event support period index
+
+Revision ID: b4d9a7e25c18
+Revises: 8f31c6d2e4b7
+Create Date: 2026-10-18 15:48:02.113674
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4d9a7e25c18'
+down_revision: Union[str, None] = '8f31c6d2e4b7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def is_postgresql() -> bool:
+    # Range GiST indexes are PostgreSQL only
+    return op.get_context().dialect.name == 'postgresql'
+
+
+def upgrade() -> None:
+    if not is_postgresql():
+        return
+    # btree_gist allows the integer column in the GiST index
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_event_support_period',
+            'event',
+            ['support_employee_id', sa.text('tsrange(datetime_start, datetime_end)')],
+            unique=False,
+            postgresql_using='gist',
+            postgresql_where=sa.text('support_employee_id IS NOT NULL'),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    if not is_postgresql():
+        return
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_event_support_period',
+            table_name='event',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+    # The btree_gist extension is kept, other objects may depend on it
@@ -0,0 +1,45 @@
+"""added change tracking dates
+
+Revision ID: e6a1c4b8f2d3
+Revises: b4d9a7e25c18
+Create Date: 2026-10-18 17:02:41.239517
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6a1c4b8f2d3'
+down_revision: Union[str, None] = 'b4d9a7e25c18'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('contract', sa.Column('updated_date', sa.DateTime(), nullable=True))
+    op.add_column('event', sa.Column('updated_date', sa.DateTime(), nullable=True))
+    # Existing contracts count as changed when created, events (without
+    # creation date) now
+    op.execute("UPDATE contract SET updated_date = created_date")
+    op.execute("UPDATE event SET updated_date = CURRENT_TIMESTAMP")
+    with op.batch_alter_table('contract') as batch_op:
+        batch_op.alter_column('updated_date', existing_type=sa.DateTime(), nullable=False)
+    with op.batch_alter_table('event') as batch_op:
+        batch_op.alter_column('updated_date', existing_type=sa.DateTime(), nullable=False)
+
+    op.create_index('ix_client_updated_date', 'client', ['updated_date'], unique=False)
+    op.create_index('ix_contract_updated_date', 'contract', ['updated_date'], unique=False)
+    op.create_index('ix_event_updated_date', 'event', ['updated_date'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_event_updated_date', table_name='event')
+    op.drop_index('ix_contract_updated_date', table_name='contract')
+    op.drop_index('ix_client_updated_date', table_name='client')
+    with op.batch_alter_table('event') as batch_op:
+        batch_op.drop_column('updated_date')
+    with op.batch_alter_table('contract') as batch_op:
+        batch_op.drop_column('updated_date')
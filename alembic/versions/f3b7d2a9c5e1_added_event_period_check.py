@@ -0,0 +1,68 @@
+"""added event period check
+
+Revision ID: f3b7d2a9c5e1
+Revises: e6a1c4b8f2d3
+Create Date: 2026-10-18 21:12:36.508214
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3b7d2a9c5e1'
+down_revision: Union[str, None] = 'e6a1c4b8f2d3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def is_postgresql() -> bool:
+    # Range GiST indexes are PostgreSQL only
+    return op.get_context().dialect.name == 'postgresql'
+
+
+def recreate_support_period_index(where: str) -> None:
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_event_support_period',
+            table_name='event',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.create_index(
+            'ix_event_support_period',
+            'event',
+            ['support_employee_id', sa.text('tsrange(datetime_start, datetime_end)')],
+            unique=False,
+            postgresql_using='gist',
+            postgresql_where=sa.text(where),
+            postgresql_concurrently=True,
+        )
+
+
+def upgrade() -> None:
+    # Events ending before they start can only be typing errors (start and
+    # end swapped): both values are kept
+    op.execute(
+        "UPDATE event SET datetime_start = datetime_end, datetime_end = datetime_start"
+        " WHERE datetime_end < datetime_start"
+    )
+    with op.batch_alter_table('event') as batch_op:
+        batch_op.create_check_constraint(
+            'ck_event_period', 'datetime_end >= datetime_start'
+        )
+    if is_postgresql():
+        recreate_support_period_index(
+            'support_employee_id IS NOT NULL'
+            ' AND datetime_start IS NOT NULL AND datetime_end IS NOT NULL'
+        )
+
+
+def downgrade() -> None:
+    if is_postgresql():
+        recreate_support_period_index('support_employee_id IS NOT NULL')
+    with op.batch_alter_table('event') as batch_op:
+        batch_op.drop_constraint('ck_event_period', type_='check')
@@ -0,0 +1,668 @@
+"""Time every CLI command on seeded databases of several sizes
+
+A throwaway PostgreSQL cluster is created with initdb in a temporary
+directory (PostgreSQL server binaries must be in PATH), or with
+--configured-database the database of DB_* settings is used: it is emptied,
+so it must be dedicated to benchmarks. With --sqlite a temporary SQLite file
+is used instead, without server.
+
+For each scale, as many clients, contracts and events are seeded, then each
+command is invoked in-process through click's CliRunner. Latency (median and
+max of the runs), statements count and rows of a run, and peak memory
+allocated by Python (tracemalloc, on a separate run) are recorded.
+
+Usage : python benchmark_commands.py [--scales 10000,100000,1000000]
+        [--runs 5] [--output baseline.json] [--compare baseline.json]
+        [--configured-database | --sqlite]
+Exit code is 1 if --compare is given and a command regressed: slower than
+the baseline by more than --tolerance, or running more statements.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from time import perf_counter
+from typing import Callable, NamedTuple
+
+DEFAULT_SCALES = [10000, 100000, 1000000]
+DEFAULT_RUNS = 5
+DEFAULT_TOLERANCE = 0.2
+SEED_CHUNK_SIZE = 10000
+IMPORT_ROWS = 1000
+BENCH_DATABASE = "epiceventscrm_bench"
+PASSWORD = "benchmark"
+
+COMMERCIALS = 20
+SUPPORTS = 20
+GESTIONS = 5
+
+
+class Scenario(NamedTuple):
+    """A command to time, run as first employee of role
+
+    args returns command line arguments from fixtures, for the run number i
+    (so a run never creates or updates the same object as another run)."""
+
+    name: str
+    role: str
+    args: Callable[[dict, int], list[str]]
+
+
+SCENARIOS = [
+    Scenario("login", "gestion", lambda f, i: ["login", "gestion1", PASSWORD]),
+    # Only the first run has a token to delete, the next ones find none
+    Scenario("logoff", "gestion", lambda f, i: ["logoff"]),
+    Scenario(
+        "benchmark-hashing",
+        "gestion",
+        lambda f, i: ["benchmark-hashing", "--repeat", "1"],
+    ),
+    Scenario(
+        "display-client", "commercial", lambda f, i: ["display-client", "-id", "1"]
+    ),
+    Scenario(
+        "display-client (100 ids)",
+        "commercial",
+        lambda f, i: ["display-client", "-id", "1-100"],
+    ),
+    Scenario(
+        "display-contract", "commercial", lambda f, i: ["display-contract", "-id", "1"]
+    ),
+    Scenario("display-event", "commercial", lambda f, i: ["display-event", "-id", "1"]),
+    Scenario(
+        "search-clients",
+        "commercial",
+        lambda f, i: ["search-clients", f"Nom{f['scale'] // 2}"],
+    ),
+    Scenario(
+        "list-contracts (page)",
+        "commercial",
+        lambda f, i: ["list-contracts", "--page-size", "100", "--after-id", "1000"],
+    ),
+    Scenario(
+        "list-contracts (not signed)",
+        "commercial",
+        lambda f, i: ["list-contracts", "--not-signed", "--page-size", "100"],
+    ),
+    Scenario(
+        "list-events (page)",
+        "support",
+        lambda f, i: ["list-events", "--page-size", "100", "--after-id", "1000"],
+    ),
+    Scenario(
+        "list-events (no support)",
+        "gestion",
+        lambda f, i: ["list-events", "--no-support", "--page-size", "100"],
+    ),
+    Scenario("dashboard", "commercial", lambda f, i: ["dashboard"]),
+    Scenario("report monthly", "gestion", lambda f, i: ["report", "monthly"]),
+    Scenario("report commercials", "gestion", lambda f, i: ["report", "commercials"]),
+    Scenario(
+        "report commercials (live)",
+        "gestion",
+        lambda f, i: ["report", "commercials", "--live"],
+    ),
+    Scenario("report refresh", "gestion", lambda f, i: ["report", "refresh"]),
+    Scenario(
+        "find-available-support",
+        "gestion",
+        lambda f, i: ["find-available-support", "--event", str(f["event_ids"][i])],
+    ),
+    Scenario(
+        "export employee",
+        "gestion",
+        lambda f, i: ["export", "employee", os.devnull, "--format", "csv"],
+    ),
+    Scenario(
+        "export client",
+        "commercial",
+        lambda f, i: ["export", "client", os.devnull, "--format", "csv"],
+    ),
+    Scenario(
+        "export contract (all)",
+        "commercial",
+        lambda f, i: ["export", "contract", os.devnull, "--format", "csv"],
+    ),
+    Scenario(
+        "export event",
+        "gestion",
+        lambda f, i: ["export", "event", os.devnull, "--format", "csv"],
+    ),
+    Scenario(
+        f"import client ({IMPORT_ROWS} rows)",
+        "commercial",
+        lambda f, i: ["import", "client", f["import_paths"][i]],
+    ),
+    # Full copy, then copies of the few rows changed by the next scenarios
+    Scenario("sync --full", "gestion", lambda f, i: ["sync", "--full"]),
+    Scenario("sync", "gestion", lambda f, i: ["sync"]),
+    Scenario(
+        "list-events (snapshot)",
+        "support",
+        lambda f, i: ["--snapshot", "list-events", "--page-size", "100"],
+    ),
+    Scenario(
+        "create-client",
+        "commercial",
+        lambda f, i: [
+            "create-client",
+            "-ln",
+            f"Bench{i}",
+            "-em",
+            f"bench{i}@example.com",
+        ],
+    ),
+    Scenario(
+        "update-client",
+        "commercial",
+        lambda f, i: [
+            "update-client",
+            "-id",
+            str(f["client_ids"][i]),
+            "-sn",
+            f"Bench{i}",
+        ],
+    ),
+    Scenario(
+        "create-contract",
+        "gestion",
+        lambda f, i: ["create-contract", "-cl", str(f["client_ids"][i]), "-ta", "1000"],
+    ),
+    Scenario(
+        "update-contract",
+        "commercial",
+        lambda f, i: ["update-contract", "-co", str(f["contract_ids"][i]), "-ra", "10"],
+    ),
+    Scenario(
+        "create-event",
+        "commercial",
+        lambda f, i: [
+            "create-event",
+            "-co",
+            str(f["free_contract_ids"][i]),
+            "-ds",
+            "01/06/2030 10:00",
+            "-es",
+            "01/06/2030 18:00",
+            "-lo",
+            "Bench",
+            "-at",
+            "10",
+            "-no",
+            "",
+        ],
+    ),
+    Scenario(
+        "update-event",
+        "support",
+        lambda f, i: [
+            "update-event",
+            "-ev",
+            str(f["support_event_ids"][i]),
+            "-at",
+            "50",
+        ],
+    ),
+    Scenario(
+        "add-event-support",
+        "gestion",
+        lambda f, i: [
+            "add-event-support",
+            "-ev",
+            str(f["unsupported_event_ids"][i]),
+            "-su",
+            str(f["support_id"]),
+            "--allow-conflict",
+        ],
+    ),
+    Scenario(
+        "update-contracts (dry run)",
+        "gestion",
+        lambda f, i: [
+            "update-contracts",
+            "--status",
+            "pending",
+            "--before",
+            "01/01/2022",
+            "--set-status",
+            "archived",
+            "--dry-run",
+        ],
+    ),
+    Scenario(
+        "update-contracts",
+        "gestion",
+        lambda f, i: [
+            "update-contracts",
+            "--status",
+            "pending",
+            "--before",
+            "01/01/2022",
+            "--set-remaining-amount",
+            "0",
+        ],
+    ),
+    # Reassigned to the same employee, so every run updates the same events
+    Scenario(
+        "update-events",
+        "gestion",
+        lambda f, i: [
+            "update-events",
+            "-em",
+            str(f["support_id"]),
+            "-ss",
+            str(f["support_id"]),
+            "--allow-conflict",
+        ],
+    ),
+    # Dry run, as a real run leaves no event without support for next runs
+    Scenario(
+        "auto-assign-support (dry run)",
+        "gestion",
+        lambda f, i: ["auto-assign-support", "--dry-run"],
+    ),
+    Scenario(
+        "update-employee",
+        "gestion",
+        lambda f, i: ["update-employee", "-id", str(2 + i), "-un", f"renamed{i}"],
+    ),
+    # Last commercials, whose clients aren't used by other scenarios
+    Scenario(
+        "deactivate-employee",
+        "gestion",
+        lambda f, i: ["deactivate-employee", "-id", str(COMMERCIALS - i), "--yes"],
+    ),
+    Scenario(
+        "create-employee",
+        "gestion",
+        lambda f, i: [
+            "create-employee",
+            "-un",
+            f"bench{i}",
+            "-pw",
+            PASSWORD,
+            "-ro",
+            "support",
+        ],
+    ),
+]
+
+
+@contextmanager
+def throwaway_cluster():
+    """Run a PostgreSQL server on a unix socket in a temporary directory"""
+    if shutil.which("initdb") is None or shutil.which("pg_ctl") is None:
+        sys.exit("initdb and pg_ctl are needed, or use --configured-database.")
+    directory = tempfile.mkdtemp(prefix="epiceventscrm_bench_")
+    data = os.path.join(directory, "data")
+    user = "bench"
+    subprocess.run(
+        ["initdb", "-D", data, "-U", user, "--auth=trust"],
+        check=True,
+        capture_output=True,
+    )
+    subprocess.run(
+        [
+            "pg_ctl",
+            "start",
+            "-w",
+            "-D",
+            data,
+            "-l",
+            os.path.join(directory, "server.log"),
+            # No TCP listening, the socket is in the temporary directory
+            "-o",
+            f"-k {directory} -h ''",
+        ],
+        check=True,
+        capture_output=True,
+    )
+    try:
+        subprocess.run(
+            ["createdb", "-h", directory, "-U", user, BENCH_DATABASE],
+            check=True,
+            capture_output=True,
+        )
+        os.environ.update(
+            DB_HOST=directory,
+            DB_USERNAME=user,
+            DB_PASSWORD="",
+            DATEBASE_NAME=BENCH_DATABASE,
+        )
+        yield
+    finally:
+        subprocess.run(
+            ["pg_ctl", "stop", "-D", data, "-m", "fast"], capture_output=True
+        )
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def create_schema():
+    from alembic import command
+    from alembic.config import Config
+
+    command.upgrade(
+        Config(os.path.join(os.path.dirname(__file__), "alembic.ini")), "head"
+    )
+
+
+def seed(scale: int):
+    """Replace data with scale clients, contracts and events
+
+    Contracts are signed but one in three. One contract in ten has no event,
+    one event in four has no support employee."""
+    from sqlalchemy import insert, text
+
+    from controllers.auth import password_hasher
+    from db import get_admin_engine
+    from models import Client, Contract, ContractStatus, Employee, Event, RoleEmployees
+
+    randomizer = random.Random(scale)
+    start = datetime(2021, 1, 1)
+    hashed_password = password_hasher.hash(PASSWORD)
+    employees = [
+        {"username": f"{role.name}{number}", "password": hashed_password, "role": role}
+        for role, count in (
+            (RoleEmployees.commercial, COMMERCIALS),
+            (RoleEmployees.support, SUPPORTS),
+            (RoleEmployees.gestion, GESTIONS),
+        )
+        for number in range(1, count + 1)
+    ]
+    support_ids = range(COMMERCIALS + 1, COMMERCIALS + SUPPORTS + 1)
+
+    def chunks(make_row: Callable[[int], dict]):
+        for chunk_start in range(0, scale, SEED_CHUNK_SIZE):
+            yield [
+                make_row(i)
+                for i in range(chunk_start, min(chunk_start + SEED_CHUNK_SIZE, scale))
+            ]
+
+    def client_row(i: int) -> dict:
+        created_date = start + timedelta(minutes=randomizer.randrange(3 * 525600))
+        return {
+            "firstname": f"Prénom{i}",
+            "lastname": f"Nom{i}",
+            "email": f"client{i}@example.com",
+            # Client.tel is a 32 bits integer: French numbers without leading 0
+            "tel": 600000000 + i,
+            "society_name": f"Société {i % 5000}",
+            "created_date": created_date,
+            "updated_date": created_date,
+            "commercial_employee_id": i % COMMERCIALS + 1,
+        }
+
+    def contract_row(i: int) -> dict:
+        total_amount = float(randomizer.randrange(500, 50000))
+        created_date = start + timedelta(minutes=randomizer.randrange(3 * 525600))
+        return {
+            "client_id": i + 1,
+            "total_amount": total_amount,
+            "amount_to_pay": total_amount * randomizer.choice((0, 0, 0.5, 1)),
+            "created_date": created_date,
+            "updated_date": created_date,
+            "status": ContractStatus.pending if i % 3 == 0 else ContractStatus.signed,
+        }
+
+    def event_row(i: int) -> dict:
+        datetime_start = start + timedelta(hours=randomizer.randrange(5 * 8760))
+        return {
+            "contrat_id": i + 1,
+            "datetime_start": datetime_start,
+            "datetime_end": datetime_start
+            + timedelta(hours=randomizer.randrange(2, 48)),
+            "location": f"Lieu {i % 300}",
+            "support_employee_id": support_ids[(i + 1) % SUPPORTS] if i % 4 else None,
+            "attendees": randomizer.randrange(10, 500),
+            "notes": "",
+            # In the past, so "sync" only copies events changed by scenarios
+            "updated_date": start + timedelta(minutes=randomizer.randrange(3 * 525600)),
+        }
+
+    with get_admin_engine().begin() as connection:
+        is_postgresql = connection.dialect.name == "postgresql"
+        if is_postgresql:
+            connection.execute(
+                text(
+                    "TRUNCATE event, contract, client, employee RESTART IDENTITY CASCADE"
+                )
+            )
+        else:
+            # Without AUTOINCREMENT, SQLite ids restart from 1 once tables are empty
+            for table in ("event", "contract", "client", "employee"):
+                connection.execute(text(f"DELETE FROM {table}"))
+        connection.execute(insert(Employee), employees)
+        for model, make_row in ((Client, client_row), (Contract, contract_row)):
+            for chunk in chunks(make_row):
+                connection.execute(insert(model), chunk)
+        for chunk in chunks(event_row):
+            chunk = [row for row in chunk if row["contrat_id"] % 10 != 1]
+            connection.execute(insert(Event), chunk)
+        connection.execute(text("ANALYZE"))
+        if is_postgresql:
+            connection.execute(
+                text("REFRESH MATERIALIZED VIEW contract_monthly_report")
+            )
+
+
+def write_import_files(directory: str, count: int) -> list[str]:
+    """Write a CSV file of new clients for each run of import"""
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"import_{i}.csv")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write("firstname,lastname,email,tel,society_name\n")
+            for row in range(IMPORT_ROWS):
+                file.write(
+                    f"Prénom,Import{i}_{row},import{i}_{row}@example.com,"
+                    f"{700000000 + row},Import\n"
+                )
+        paths.append(path)
+    return paths
+
+
+def load_fixtures(scale: int, runs: int, directory: str) -> dict:
+    """Pick objects that each run of a scenario can use or modify"""
+    from sqlalchemy import select
+
+    from db import get_admin_engine
+    from models import Client, Contract, ContractStatus, Employee, Event
+
+    # First run is the memory one
+    count = runs + 1
+    commercial_id = 1
+    support_id = COMMERCIALS + 1
+    with get_admin_engine().connect() as connection:
+
+        def ids(stmt):
+            return connection.scalars(stmt.limit(count)).all()
+
+        return {
+            "scale": scale,
+            "support_id": support_id,
+            "import_paths": write_import_files(directory, count),
+            "client_ids": ids(
+                select(Client.id)
+                .where(Client.commercial_employee_id == commercial_id)
+                .order_by(Client.id)
+            ),
+            "contract_ids": ids(
+                select(Contract.id)
+                .join(Contract.client)
+                .where(Client.commercial_employee_id == commercial_id)
+                .order_by(Contract.id)
+            ),
+            "free_contract_ids": ids(
+                select(Contract.id)
+                .join(Contract.client)
+                .where(
+                    Client.commercial_employee_id == commercial_id,
+                    Contract.status == ContractStatus.signed,
+                    ~Contract.associated_event.has(),
+                )
+                .order_by(Contract.id)
+            ),
+            "event_ids": ids(select(Event.id).order_by(Event.id)),
+            "support_event_ids": ids(
+                select(Event.id)
+                .where(Event.support_employee_id == support_id)
+                .order_by(Event.id)
+            ),
+            "unsupported_event_ids": ids(
+                select(Event.id)
+                .where(Event.support_employee_id.is_(None))
+                .order_by(Event.id)
+            ),
+        }
+
+
+def invoke(runner, args: list[str]):
+    from epiceventscrm import cli
+
+    result = runner.invoke(cli, args, catch_exceptions=False)
+    if result.exit_code != 0:
+        raise RuntimeError(f"{' '.join(args)} failed : {result.output}")
+
+
+def time_scenario(runner, scenario: Scenario, fixtures: dict, runs: int) -> dict:
+    from db import get_query_stats, reset_query_stats
+
+    invoke(runner, ["login", f"{scenario.role}1", PASSWORD])
+
+    tracemalloc.start()
+    invoke(runner, scenario.args(fixtures, 0))
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    durations = []
+    for i in range(1, runs + 1):
+        # Light commands (like logoff) don't reset statements counters
+        reset_query_stats()
+        start = perf_counter()
+        invoke(runner, scenario.args(fixtures, i))
+        durations.append((perf_counter() - start) * 1000)
+    query_stats = get_query_stats()
+
+    return {
+        "median_ms": round(statistics.median(durations), 3),
+        "max_ms": round(max(durations), 3),
+        "statements": query_stats["statements"],
+        "rows": query_stats["rows"],
+        "peak_memory_kb": round(peak_memory / 1024, 1),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for scale, commands in results.items():
+        for name, measure in commands.items():
+            reference = baseline.get(scale, {}).get(name)
+            if reference is None:
+                continue
+            if measure["median_ms"] > reference["median_ms"] * (1 + tolerance):
+                regressions.append(
+                    f"{scale} {name} : {measure['median_ms']:.1f} ms "
+                    f"(baseline {reference['median_ms']:.1f} ms)"
+                )
+            if measure["statements"] > reference["statements"]:
+                regressions.append(
+                    f"{scale} {name} : {measure['statements']} statements "
+                    f"(baseline {reference['statements']})"
+                )
+    return regressions
+
+
+def run_benchmarks(scales: list[int], runs: int, directory: str) -> dict:
+    from click.testing import CliRunner
+
+    create_schema()
+    runner = CliRunner()
+    results = {}
+    for scale in scales:
+        print(f"Seeding {scale} rows...", file=sys.stderr)
+        seed(scale)
+        fixtures = load_fixtures(scale, runs, directory)
+        results[str(scale)] = {}
+        for scenario in SCENARIOS:
+            measure = time_scenario(runner, scenario, fixtures, runs)
+            results[str(scale)][scenario.name] = measure
+            print(
+                f"{scale:>8} {scenario.name:<30} {measure['median_ms']:9.1f} ms"
+                f" {measure['statements']:4} stmts {measure['peak_memory_kb']:10.1f} kB"
+            )
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--scales",
+        type=lambda value: [int(scale) for scale in value.split(",")],
+        default=DEFAULT_SCALES,
+    )
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS)
+    parser.add_argument("--output", help="JSON file where results are written.")
+    parser.add_argument("--compare", help="Baseline JSON file to compare with.")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    database = parser.add_mutually_exclusive_group()
+    database.add_argument(
+        "--configured-database",
+        action="store_true",
+        help="Use (and empty) the database of DB_* settings instead of initdb.",
+    )
+    database.add_argument(
+        "--sqlite",
+        action="store_true",
+        help="Use a temporary SQLite file instead of initdb.",
+    )
+    args = parser.parse_args()
+
+    # Set before the application reads its settings
+    directory = tempfile.mkdtemp(prefix="epiceventscrm_token_")
+    os.environ.update(
+        PATH_TOKEN=os.path.join(directory, "token"),
+        SNAPSHOT_PATH=os.path.join(directory, "snapshot.db"),
+        DEBUG_MODE="False",
+        SENTRY_DSN="",
+    )
+    if args.sqlite:
+        os.environ["DB_URL"] = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+
+    if args.configured_database or args.sqlite:
+        results = run_benchmarks(args.scales, args.runs, directory)
+    else:
+        with throwaway_cluster():
+            results = run_benchmarks(args.scales, args.runs, directory)
+    shutil.rmtree(directory, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(
+                {
+                    "date": datetime.now().isoformat(),
+                    "runs": args.runs,
+                    "results": results,
+                },
+                file,
+                indent=2,
+            )
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""Compare list rendering time against the former PrettyTable rendering
+
+Rows look like the ones of "list-contracts" (projected by attribute), output
+is written to os.devnull so only formatting and writing are measured.
+
+Usage : python benchmark_rendering.py [number of rows...]
+"""
+import os
+import sys
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import islice
+from time import perf_counter
+
+from prettytable import PrettyTable
+
+from views.lists import get_attr_as_str, print_list_objects
+
+DEFAULT_ROW_COUNTS = [1000, 10000, 100000]
+CHUNK_SIZE = 1000
+
+LIST_ATTR = [
+    "id",
+    "created_date",
+    "client.fullname",
+    "total_amount",
+    "amount_to_pay",
+    "status.name",
+    "associated_event.id",
+]
+FORMATTERS = {"created_date": "%d/%m/%Y", "total_amount": ".2f", "amount_to_pay": ".2f"}
+
+
+def generate_rows(count: int):
+    for i in range(count):
+        yield {
+            "id": i,
+            "created_date": datetime(2023, 1, 1) + timedelta(minutes=i),
+            "client.fullname": f"Client {i}",
+            "total_amount": Decimal(1000 + i),
+            "amount_to_pay": Decimal(i % 500),
+            "status.name": "signed" if i % 2 else "pending",
+            "associated_event.id": i,
+        }
+
+
+def print_with_prettytable(objects, chunk_size: int):
+    """Rendering as done before: a PrettyTable string built per chunk"""
+    iterator = iter(objects)
+    while chunk := list(islice(iterator, chunk_size)):
+        table = PrettyTable(header_style="cap", junction_char=" ", horizontal_char="–")
+        table.field_names = LIST_ATTR
+        for obj in chunk:
+            table.add_row(
+                [get_attr_as_str(obj, attr, FORMATTERS.get(attr)) for attr in LIST_ATTR]
+            )
+        print(table.get_string())
+
+
+def measure_ms(function, count: int) -> float:
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        start = perf_counter()
+        function(generate_rows(count))
+        return (perf_counter() - start) * 1000
+
+
+def main(row_counts: list[int]) -> int:
+    print(f"{'rows':>8} {'prettytable':>14} {'streaming':>12} {'speedup':>8}")
+    for count in row_counts:
+        prettytable_ms = measure_ms(
+            lambda rows: print_with_prettytable(rows, CHUNK_SIZE), count
+        )
+        streaming_ms = measure_ms(
+            lambda rows: print_list_objects(
+                rows, LIST_ATTR, FORMATTERS, chunk_size=CHUNK_SIZE
+            ),
+            count,
+        )
+        print(
+            f"{count:>8} {prettytable_ms:>11.1f} ms {streaming_ms:>9.1f} ms"
+            f" {prettytable_ms / streaming_ms:>7.1f}x"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main([int(arg) for arg in sys.argv[1:]] or DEFAULT_ROW_COUNTS))
@@ -0,0 +1,54 @@
+"""Check import time of light CLI invocations against a budget
+
+Each invocation is run with "python -X importtime", which reports on stderr
+the cumulative import time of every top-level import. The interpreter's own
+startup imports are measured apart and subtracted.
+
+Usage : python check_startup.py [budget in ms]
+Exit code is 1 if any invocation exceeds the budget.
+"""
+import subprocess
+import sys
+
+DEFAULT_BUDGET_MS = 50
+
+INVOCATIONS = [
+    ["--help"],
+    ["logoff", "--help"],
+]
+
+
+def measure_import_ms(args: list[str]) -> float:
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        capture_output=True,
+        text=True,
+    )
+    total_us = 0
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        # Nested imports are indented and already counted by their parent
+        if cumulative.strip().isdigit() and not name.startswith("  "):
+            total_us += int(cumulative)
+    return total_us / 1000
+
+
+def main(budget_ms: float) -> int:
+    baseline_ms = measure_import_ms(["-c", "pass"])
+    exit_code = 0
+    for invocation in INVOCATIONS:
+        import_ms = (
+            measure_import_ms(["-m", "epiceventscrm", *invocation]) - baseline_ms
+        )
+        within_budget = import_ms <= budget_ms
+        status = "ok" if within_budget else "OVER BUDGET"
+        print(f"{' '.join(invocation):<20} {import_ms:7.1f} ms  {status}")
+        if not within_budget:
+            exit_code = 1
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main(float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_BUDGET_MS))
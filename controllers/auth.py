@@ -1,26 +1,51 @@
+import hashlib
+import hmac
+import json
 import os
+from collections import namedtuple
 from datetime import datetime, timedelta
 from functools import wraps
+from itertools import product
+from statistics import median
+from time import perf_counter, time
 
 import click
 import jwt
-import sentry_sdk
 from dotenv import load_dotenv
 from passlib.hash import argon2
 from sqlalchemy import select
+from sqlalchemy.orm import make_transient_to_detached
 from sqlalchemy.orm.session import Session
 
+from controllers.token import PATH_AUTH_CACHE, PATH_TOKEN
 from db import get_session
-from models import Employee
+from models import Employee, RoleEmployees
+from telemetry import set_user
 from tools import pass_session
+from views.lists import print_list_objects
 from views.messages import msg_authentication_required, msg_unautorized_action
 from views.messages import print_messages as mprint
 
 load_dotenv()
 
+HashingBenchmark = namedtuple(
+    "HashingBenchmark",
+    ["time_cost", "memory_cost", "parallelism", "hash_ms", "verify_ms"],
+)
+
 SECRET = os.getenv("SECRET")
-PATH_TOKEN = os.getenv("PATH_TOKEN")
 TOKEN_VALIDITY_HOURS = os.getenv("TOKEN_VALIDITY_HOURS")
+AUTH_CACHE_SECONDS = int(os.getenv("AUTH_CACHE_SECONDS", 0))
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", argon2.default_rounds))
+ARGON2_MEMORY_COST = int(os.getenv("ARGON2_MEMORY_COST", argon2.memory_cost))
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", argon2.parallelism))
+
+# Hasher to use for every password, with cost profile from config file .env
+password_hasher = argon2.using(
+    rounds=ARGON2_TIME_COST,
+    memory_cost=ARGON2_MEMORY_COST,
+    parallelism=ARGON2_PARALLELISM,
+)
 
 
 auth_group = click.Group()
@@ -34,79 +59,261 @@ def login(session: Session, username: str, password: str, persistent: bool = Fal
     """Use USERNAME and PASSWORD to log you in
 
     Use a local JWT token so then you can perform authentification required actions.
-    Token has a validity as describe in config file .env"""
+    Token has a validity as describe in config file .env
+    Password is hashed again if hashing cost profile has changed."""
     stmt = select(Employee).where(Employee.username == username)
     user = session.scalars(stmt).first()
 
-    if not user or not argon2.verify(secret=password, hash=user.password):
+    if not user or not password_hasher.verify(secret=password, hash=user.password):
         mprint("Try to login but fail. Try again.", level="warning")
         return
 
+    # Cost profile changed since password was hashed
+    if password_hasher.needs_update(user.password):
+        user.password = password_hasher.hash(password)
+
     expiration_date = datetime.now() + timedelta(hours=int(TOKEN_VALIDITY_HOURS))
     payload = {
         "user_id": user.id,
         "user_username": user.username,
+        "user_role": user.role.name,
+        "auth_epoch": user.auth_epoch,
         "expiration_timestamp": expiration_date.timestamp(),
     }
     token = jwt.encode(payload=payload, key=SECRET)
 
     with open(PATH_TOKEN, "w") as file:
         file.write(token)
+    save_verification(token)
+    if ctx := click.get_current_context(silent=True):
+        ctx.meta["TOKEN"] = token
+        ctx.meta["TOKEN_PAYLOAD"] = payload
 
     mprint("You're now connected.", level="confirm")
     return user
 
 
 @auth_group.command()
-def logoff():
-    """Log you off
+@click.option(
+    "--time-cost",
+    "-tc",
+    "time_costs",
+    help="Number of iterations to test. Can be used several times.",
+    multiple=True,
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--memory-cost",
+    "-mc",
+    "memory_costs",
+    help="Memory in kibibytes to test. Can be used several times.",
+    multiple=True,
+    type=click.IntRange(min=8),
+)
+@click.option(
+    "--parallelism",
+    "-pa",
+    "parallelisms",
+    help="Number of threads to test. Can be used several times.",
+    multiple=True,
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--repeat",
+    "-re",
+    "repeat",
+    help="Number of measures for each profile.",
+    default=5,
+    show_default=True,
+    type=click.IntRange(min=1),
+)
+def benchmark_hashing(
+    time_costs: tuple[int],
+    memory_costs: tuple[int],
+    parallelisms: tuple[int],
+    repeat: int = 5,
+):
+    """Measure password hashing cost profiles on this machine
 
-    Delete local token created when logged in."""
-    if os.path.exists(PATH_TOKEN):
-        os.remove(PATH_TOKEN)
-        click.echo("Succefully logged off.")
-    else:
-        click.echo("No peristent logging detected. Nothing changed.")
+    Every combination of given costs is tested, actual profile from config file
+    .env is used for costs not given. Displays median time to hash and verify."""
+    results = []
+    for time_cost, memory_cost, parallelism in product(
+        time_costs or [ARGON2_TIME_COST],
+        memory_costs or [ARGON2_MEMORY_COST],
+        parallelisms or [ARGON2_PARALLELISM],
+    ):
+        hasher = argon2.using(
+            rounds=time_cost, memory_cost=memory_cost, parallelism=parallelism
+        )
+        hash_durations, verify_durations = [], []
+        for _ in range(repeat):
+            start = perf_counter()
+            password_hash = hasher.hash("benchmark password")
+            hash_durations.append(perf_counter() - start)
 
+            start = perf_counter()
+            hasher.verify("benchmark password", password_hash)
+            verify_durations.append(perf_counter() - start)
 
-def get_user_from_token():
+        results.append(
+            HashingBenchmark(
+                time_cost,
+                memory_cost,
+                parallelism,
+                median(hash_durations) * 1000,
+                median(verify_durations) * 1000,
+            )
+        )
+
+    print_list_objects(
+        results,
+        ["time_cost", "memory_cost", "parallelism", "hash_ms", "verify_ms"],
+        title="Profils de coût Argon2",
+        headers=[
+            "Itérations",
+            "Mémoire (ko)",
+            "Parallélisme",
+            "Hachage (ms)",
+            "Vérification (ms)",
+        ],
+        formatters={"hash_ms": ".1f", "verify_ms": ".1f"},
+    )
+
+
+def read_token() -> str | None:
+    """Return local token, or None if there is no token"""
     try:
-        jwt_token = open(PATH_TOKEN).read()
+        return open(PATH_TOKEN).read()
     except OSError:
         return
-    else:
-        header_data = jwt.get_unverified_header(jwt_token)
-        payload = jwt.decode(
-            jwt_token,
-            key=SECRET,
-            algorithms=[
-                header_data["alg"],
-            ],
+
+
+def decode_token(jwt_token: str) -> dict:
+    header_data = jwt.get_unverified_header(jwt_token)
+    return jwt.decode(
+        jwt_token,
+        key=SECRET,
+        algorithms=[
+            header_data["alg"],
+        ],
+    )
+
+
+def verification_mac(jwt_token: str, verified_at: float) -> str:
+    """Sign a verification time for a token, so it can't be forged locally"""
+    signature = jwt_token.rsplit(".", 1)[-1]
+    return hmac.new(
+        SECRET.encode(), f"{signature}:{verified_at!r}".encode(), hashlib.sha256
+    ).hexdigest()
+
+
+def is_recently_verified(jwt_token: str) -> bool:
+    """Check if token has been verified against database less than
+    AUTH_CACHE_SECONDS ago (never with the default of 0)"""
+    if AUTH_CACHE_SECONDS <= 0:
+        return False
+    try:
+        with open(PATH_AUTH_CACHE) as file:
+            cache = json.load(file)
+        verified_at = float(cache["verified_at"])
+        mac = str(cache["mac"])
+    except (OSError, ValueError, TypeError, KeyError):
+        return False
+
+    return (
+        hmac.compare_digest(mac, verification_mac(jwt_token, verified_at))
+        and 0 <= time() - verified_at < AUTH_CACHE_SECONDS
+    )
+
+
+def save_verification(jwt_token: str):
+    if AUTH_CACHE_SECONDS <= 0:
+        return
+    verified_at = time()
+    with open(PATH_AUTH_CACHE, "w") as file:
+        json.dump(
+            {
+                "verified_at": verified_at,
+                "mac": verification_mac(jwt_token, verified_at),
+            },
+            file,
         )
 
-        user_username = payload["user_username"] or None
-        user_id = payload["user_id"] or None
 
-        expiration_datetime = datetime.fromtimestamp(payload["expiration_timestamp"])
-        if expiration_datetime < datetime.now():
-            mprint("Token is expired. You must log again.", level="warning")
+def employee_from_payload(payload: dict, session: Session | None = None) -> Employee:
+    """Return employee described by a verified token, without database query
+
+    Attributes not carried by token (like password) are loaded on first access."""
+    if session is not None:
+        key = Session.identity_key(Employee, payload["user_id"])
+        if (user := session.identity_map.get(key)) is not None:
+            return user
+
+    user = Employee(
+        id=payload["user_id"],
+        username=payload["user_username"],
+        role=RoleEmployees[payload["user_role"]],
+        auth_epoch=payload["auth_epoch"],
+    )
+    make_transient_to_detached(user)
+    if session is not None:
+        session.add(user)
+    return user
+
+
+def get_user_from_token():
+    """Return authentificated employee from local token
+
+    Token carries employee's role and authentification epoch. Epoch is compared
+    to database on each command (a primary key lookup of one column), so an
+    updated or deactivated employee's token is revoked at once. The employee
+    itself is rebuilt from the token.
+    With AUTH_CACHE_SECONDS, the comparison is skipped during this delay after
+    a verification signed with SECRET: revocation may then take this delay."""
+    ctx = click.get_current_context(silent=True)
+
+    # Token is kept in ctx.meta, shared by commands run from interactive shell
+    jwt_token = ctx.meta.get("TOKEN") if ctx else None
+    if jwt_token is None:
+        jwt_token = read_token()
+        if jwt_token is None:
             return
+        if ctx:
+            ctx.meta["TOKEN"] = jwt_token
+            ctx.meta["TOKEN_PAYLOAD"] = decode_token(jwt_token)
+    payload = ctx.meta["TOKEN_PAYLOAD"] if ctx else decode_token(jwt_token)
 
-        stmt = select(Employee).where(
-            Employee.id == user_id, Employee.username == user_username
-        )
+    if "auth_epoch" not in payload:
+        mprint("Token is outdated. You must log again.", level="warning")
+        return
 
-        ctx = click.get_current_context(silent=True)
-        if ctx and "SESSION" in ctx.meta:
-            session = ctx.meta["SESSION"]
-            assert isinstance(session, Session)
-            user = session.execute(stmt).scalar_one_or_none()
-        else:
-            with get_session().begin() as session:
-                user = session.execute(stmt).scalar_one_or_none()
-                session.expunge(user)
+    expiration_datetime = datetime.fromtimestamp(payload["expiration_timestamp"])
+    if expiration_datetime < datetime.now():
+        mprint("Token is expired. You must log again.", level="warning")
+        return
+
+    session = ctx.meta.get("SESSION") if ctx else None
+    if is_recently_verified(jwt_token):
+        return employee_from_payload(payload, session)
+
+    stmt = select(Employee.auth_epoch).where(
+        Employee.id == payload["user_id"],
+        Employee.username == payload["user_username"],
+    )
+    if session is not None:
+        assert isinstance(session, Session)
+        auth_epoch = session.execute(stmt).scalar_one_or_none()
+    else:
+        with get_session().begin() as query_session:
+            auth_epoch = query_session.execute(stmt).scalar_one_or_none()
+
+    if auth_epoch is None or auth_epoch != payload["auth_epoch"]:
+        mprint("Your session has been revoked. You must log again.", level="warning")
+        return
 
-        return user
+    save_verification(jwt_token)
+    return employee_from_payload(payload, session)
 
 
 def authentification_required(function):
@@ -121,7 +328,7 @@ def authentification_required(function):
             authentificated_user = get_user_from_token()
 
         if authentificated_user:
-            sentry_sdk.set_user(
+            set_user(
                 {
                     "id": authentificated_user.id,
                     "username": authentificated_user.username,
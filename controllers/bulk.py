@@ -0,0 +1,558 @@
+import csv
+import enum
+import json
+from datetime import datetime
+from itertools import islice
+from typing import Callable, Iterator, NamedTuple
+
+import click
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Enum,
+    Float,
+    Integer,
+    Row,
+    Select,
+    insert,
+    select,
+)
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm.session import Session
+
+from controllers.auth import authentification_required, specified_role_required
+from controllers.contract import contract_filter_options, filter_contracts
+from controllers.event import event_filter_options, filter_events
+from data_validation import email_validation
+from db import get_session
+from models import Client, Contract, ContractStatus, Employee, Event, RoleEmployees
+from tools import pass_session
+from views.messages import msg_unautorized_action
+from views.messages import print_messages as mprint
+
+bulk_group = click.Group()
+
+DATETIME_FORMAT = "%d/%m/%Y %H:%M"
+
+
+def read_rows(file, file_format: str) -> Iterator[tuple[int, dict | ValueError]]:
+    """Yield line number and row of a CSV or JSON lines file
+
+    Row is a dict, with empty values as None, or a ValueError if unreadable."""
+    if file_format == "csv":
+        reader = csv.DictReader(file)
+        rows = ((reader.line_num, row) for row in reader)
+    else:
+        rows = (
+            (line_num, line) for line_num, line in enumerate(file, 1) if line.strip()
+        )
+
+    for line_num, row in rows:
+        if file_format != "csv":
+            try:
+                row = json.loads(row)
+            except json.JSONDecodeError as e:
+                yield line_num, ValueError(f"Invalid JSON : {e}")
+                continue
+            if not isinstance(row, dict):
+                yield line_num, ValueError("Must be a JSON object.")
+                continue
+        yield line_num, {
+            key: (None if value == "" else value) for key, value in row.items()
+        }
+
+
+def required(row: dict, field: str):
+    if row.get(field) is None:
+        raise ValueError(f"{field} is required.")
+    return row[field]
+
+
+def as_str(value, field: str) -> str | None:
+    # JSON lines values may be of any JSON type
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f"{field} must be a string.")
+    return value
+
+
+def as_int(value, field: str, min: int | None = None) -> int | None:
+    if value is None:
+        return None
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be an integer.")
+    if min is not None and number < min:
+        raise ValueError(f"{field} must be greater or equal to {min}.")
+    return number
+
+
+def as_float(value, field: str, min: float | None = None) -> float | None:
+    if value is None:
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be a number.")
+    if min is not None and number < min:
+        raise ValueError(f"{field} must be greater or equal to {min}.")
+    return number
+
+
+def as_datetime(value, field: str) -> datetime | None:
+    if value is None:
+        return None
+    value = as_str(value, field)
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.strptime(value, DATETIME_FORMAT)
+    except ValueError:
+        raise ValueError(f"{field} must be ISO formatted or like '25/02/2000 16:50'.")
+
+
+def client_values(row: dict, user: Employee) -> dict:
+    email = as_str(row.get("email"), "email")
+    if email is not None:
+        is_valid, result = email_validation(email)
+        if not is_valid:
+            raise ValueError(result)
+        email = result
+
+    now = datetime.now()
+    return {
+        "firstname": as_str(row.get("firstname"), "firstname"),
+        "lastname": as_str(required(row, "lastname"), "lastname"),
+        "email": email,
+        "tel": as_int(row.get("tel"), "tel", min=0),
+        "society_name": as_str(row.get("society_name"), "society_name"),
+        "created_date": now,
+        "updated_date": now,
+        "commercial_employee_id": user.id,
+    }
+
+
+def contract_values(row: dict, user: Employee) -> dict:
+    total_amount = as_float(required(row, "total_amount"), "total_amount", min=0)
+    amount_to_pay = as_float(row.get("amount_to_pay"), "amount_to_pay")
+    status = as_str(row.get("status"), "status") or ContractStatus.pending.name
+    if status not in ContractStatus.__members__:
+        raise ValueError(f"{status} isn't a known contract status.")
+
+    return {
+        "client_id": as_int(required(row, "client_id"), "client_id"),
+        "total_amount": total_amount,
+        "amount_to_pay": total_amount if amount_to_pay is None else amount_to_pay,
+        "created_date": datetime.now(),
+        "status": ContractStatus[status],
+    }
+
+
+def event_values(row: dict, user: Employee) -> dict:
+    values = {
+        "contrat_id": as_int(required(row, "contrat_id"), "contrat_id"),
+        "datetime_start": as_datetime(
+            required(row, "datetime_start"), "datetime_start"
+        ),
+        "datetime_end": as_datetime(required(row, "datetime_end"), "datetime_end"),
+        "location": as_str(required(row, "location"), "location"),
+        "attendees": as_int(row.get("attendees"), "attendees", min=0) or 0,
+        "notes": as_str(row.get("notes"), "notes") or "",
+    }
+    if values["datetime_end"] < values["datetime_start"]:
+        raise ValueError("datetime_end is before datetime_start.")
+    return values
+
+
+def no_reference_errors(session: Session, user: Employee, values: list[dict]):
+    return {}
+
+
+def contract_reference_errors(session: Session, user: Employee, values: list[dict]):
+    """Find contracts whose client doesn't exist, with one query per chunk"""
+    client_ids = {value["client_id"] for value in values}
+    existing_ids = set(
+        session.scalars(select(Client.id).where(Client.id.in_(client_ids)))
+    )
+    return {
+        index: f"No Client object has id={value['client_id']}."
+        for index, value in enumerate(values)
+        if value["client_id"] not in existing_ids
+    }
+
+
+def event_reference_errors(session: Session, user: Employee, values: list[dict]):
+    """Find events whose contract can't receive an event from user,
+    with one query per chunk"""
+    contract_ids = {value["contrat_id"] for value in values}
+    stmt = (
+        select(Contract.id, Contract.status, Client.commercial_employee_id)
+        .join(Contract.client)
+        .where(Contract.id.in_(contract_ids))
+    )
+    contracts = {row.id: row for row in session.execute(stmt)}
+
+    errors = {}
+    for index, value in enumerate(values):
+        contract = contracts.get(value["contrat_id"])
+        if contract is None:
+            errors[index] = f"No Contract object has id={value['contrat_id']}."
+        elif contract.commercial_employee_id != user.id:
+            errors[index] = "This contract's client isn't followed by you."
+        elif contract.status != ContractStatus.signed:
+            errors[index] = "This contract isn't signed."
+    return errors
+
+
+class Importer(NamedTuple):
+    model: type
+    required_roles: list[RoleEmployees]
+    row_values: Callable[[dict, Employee], dict]
+    reference_errors: Callable[[Session, Employee, list[dict]], dict[int, str]]
+
+
+IMPORTERS = {
+    "client": Importer(
+        Client, [RoleEmployees.commercial], client_values, no_reference_errors
+    ),
+    "contract": Importer(
+        Contract, [RoleEmployees.gestion], contract_values, contract_reference_errors
+    ),
+    "event": Importer(
+        Event, [RoleEmployees.commercial], event_values, event_reference_errors
+    ),
+}
+
+
+def import_chunk(
+    importer: Importer, user: Employee, chunk: list[tuple[int, dict | ValueError]]
+) -> tuple[int, list[tuple[int, str]]]:
+    """Validate and insert a chunk of rows in its own transaction
+
+    Return number of inserted rows and rejected rows as (line, reason)."""
+    rejects = []
+    valid_lines, valid_values = [], []
+    for line, row in chunk:
+        if isinstance(row, ValueError):
+            rejects.append((line, str(row)))
+            continue
+        try:
+            valid_values.append(importer.row_values(row, user))
+            valid_lines.append(line)
+        except (TypeError, ValueError) as e:
+            rejects.append((line, str(e)))
+
+    if not valid_values:
+        return 0, rejects
+
+    try:
+        with get_session().begin() as session:
+            errors = importer.reference_errors(session, user, valid_values)
+            rejects.extend((valid_lines[index], errors[index]) for index in errors)
+            values = [
+                value for index, value in enumerate(valid_values) if index not in errors
+            ]
+            if values:
+                session.execute(insert(importer.model), values)
+    except SQLAlchemyError as e:
+        reason = f"Chunk not saved : {e.__class__.__name__}"
+        return 0, rejects + [(line, reason) for line in valid_lines]
+
+    return len(values), rejects
+
+
+@bulk_group.command(name="import")
+@click.argument(
+    "model_name",
+    metavar="MODEL",
+    type=click.Choice(list(IMPORTERS), case_sensitive=False),
+)
+@click.argument("file", type=click.File("r", encoding="utf-8"))
+@click.option(
+    "--format",
+    "-fo",
+    "file_format",
+    help="File format. Guessed from file extension if not specified.",
+    type=click.Choice(["csv", "jsonl"], case_sensitive=False),
+)
+@click.option(
+    "--chunk-size",
+    "-cs",
+    "chunk_size",
+    help="Number of rows validated and saved in each transaction.",
+    default=1000,
+    show_default=True,
+    type=click.IntRange(min=1),
+)
+@click.option(
+    "--rejects",
+    "-rj",
+    "rejects_file",
+    help="File where rejected rows are written as JSON lines.",
+    type=click.File("w", encoding="utf-8"),
+)
+@authentification_required
+@specified_role_required([RoleEmployees.gestion, RoleEmployees.commercial])
+def import_objects(
+    user: Employee | None,
+    model_name: str,
+    file,
+    file_format: str | None = None,
+    chunk_size: int = 1000,
+    rejects_file=None,
+):
+    """Import clients, contracts or events from a CSV or JSON lines FILE
+
+    Columns are named as model's attributes. Rows are validated and saved by
+    chunks, each in its own transaction. Invalid rows are rejected and reported
+    without stopping the import.
+
+    Only commercial team employees can import clients and events,
+    only gestion team employees can import contracts."""
+    importer = IMPORTERS[model_name.lower()]
+    if user.role not in importer.required_roles:
+        msg_unautorized_action()
+        raise click.Abort()
+
+    if file_format is None:
+        file_format = "jsonl" if file.name.endswith((".jsonl", ".ndjson")) else "csv"
+
+    rows = read_rows(file, file_format.lower())
+
+    inserted, rejected = 0, 0
+    while chunk := list(islice(rows, chunk_size)):
+        chunk_inserted, rejects = import_chunk(importer, user, chunk)
+        inserted += chunk_inserted
+        rejected += len(rejects)
+        for line, reason in sorted(rejects):
+            if rejects_file is not None:
+                rejects_file.write(json.dumps({"line": line, "reason": reason}) + "\n")
+            else:
+                mprint(f"Line {line} rejected : {reason}", level="warning")
+
+    mprint(f"Import done : {inserted} saved, {rejected} rejected.", level="confirm")
+
+
+def export_value(value):
+    """Return a value as written in CSV and JSON lines files"""
+    if isinstance(value, enum.Enum):
+        return value.name
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def write_csv(path: str, columns: list[Column], chunks: Iterator[list[Row]]):
+    with click.open_file(path, "w", encoding="utf-8") as file:
+        writer = csv.writer(file, lineterminator="\n")
+        writer.writerow([column.name for column in columns])
+        for chunk in chunks:
+            writer.writerows([export_value(value) for value in row] for row in chunk)
+
+
+def write_jsonl(path: str, columns: list[Column], chunks: Iterator[list[Row]]):
+    names = [column.name for column in columns]
+    with click.open_file(path, "w", encoding="utf-8") as file:
+        for chunk in chunks:
+            file.writelines(
+                json.dumps(dict(zip(names, map(export_value, row)))) + "\n"
+                for row in chunk
+            )
+
+
+def write_parquet(path: str, columns: list[Column], chunks: Iterator[list[Row]]):
+    """Write each chunk of rows as a row group of a Parquet file
+
+    Require optional package pyarrow."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise click.ClickException("Parquet export requires pyarrow package.")
+    if path == "-":
+        raise click.ClickException("Parquet export can't be written to stdout.")
+
+    def arrow_type(column_type):
+        # Enum is a subclass of String, so it must be tested first
+        if isinstance(column_type, Enum):
+            return pa.string()
+        if isinstance(column_type, Integer):
+            return pa.int64()
+        if isinstance(column_type, Float):
+            return pa.float64()
+        if isinstance(column_type, DateTime):
+            return pa.timestamp("us")
+        return pa.string()
+
+    schema = pa.schema([(column.name, arrow_type(column.type)) for column in columns])
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in chunks:
+            arrays = [
+                pa.array(
+                    [
+                        value.name if isinstance(value, enum.Enum) else value
+                        for value in values
+                    ],
+                    type=field.type,
+                )
+                for field, values in zip(schema, zip(*chunk))
+            ]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+
+WRITERS = {"csv": write_csv, "jsonl": write_jsonl, "parquet": write_parquet}
+
+
+def exported_columns(model) -> list[Column]:
+    """Return model's table columns, except secrets"""
+    return [column for column in model.__table__.columns if column.name != "password"]
+
+
+def export_rows(
+    session: Session,
+    stmt: Select,
+    columns: list[Column],
+    path: str,
+    file_format: str | None,
+    chunk_size: int,
+):
+    """Stream rows of stmt from a server-side cursor to a file, chunk by chunk"""
+    if file_format is None:
+        if path.endswith(".parquet"):
+            file_format = "parquet"
+        elif path.endswith((".jsonl", ".ndjson")):
+            file_format = "jsonl"
+        else:
+            file_format = "csv"
+
+    exported = 0
+
+    def counted_chunks(chunks):
+        nonlocal exported
+        for chunk in chunks:
+            exported += len(chunk)
+            yield chunk
+
+    result = session.execute(stmt.execution_options(yield_per=chunk_size))
+    WRITERS[file_format.lower()](path, columns, counted_chunks(result.partitions()))
+
+    # Don't mix message with exported data written to stdout
+    if path != "-":
+        mprint(f"Export done : {exported} rows written.", level="confirm")
+
+
+def export_options(function):
+    """Add file and chunk options to an export command"""
+    function = click.option(
+        "--chunk-size",
+        "-cs",
+        "chunk_size",
+        help="Number of rows fetched from database and written at once.",
+        default=10000,
+        show_default=True,
+        type=click.IntRange(min=1),
+    )(function)
+    function = click.option(
+        "--format",
+        "-fo",
+        "file_format",
+        help="File format. Guessed from file extension if not specified.",
+        type=click.Choice(list(WRITERS), case_sensitive=False),
+    )(function)
+    function = click.argument(
+        "path", metavar="FILE", type=click.Path(dir_okay=False, allow_dash=True)
+    )(function)
+    return function
+
+
+@bulk_group.group()
+def export():
+    """Export objects to a CSV, JSON lines or Parquet FILE
+
+    Rows are streamed from database by chunks, so memory use doesn't depend
+    on the number of exported rows. Use "-" as FILE to write to stdout."""
+
+
+@export.command(name="employee")
+@export_options
+@authentification_required
+@specified_role_required([RoleEmployees.gestion])
+@pass_session
+def export_employees(
+    session: Session,
+    user: Employee | None,
+    path: str,
+    file_format: str | None = None,
+    chunk_size: int = 10000,
+):
+    """Export employees, without passwords
+
+    Only gestion team employees can perform this action."""
+    columns = exported_columns(Employee)
+    stmt = select(*columns).order_by(Employee.id)
+    export_rows(session, stmt, columns, path, file_format, chunk_size)
+
+
+@export.command(name="client")
+@export_options
+@authentification_required
+@pass_session
+def export_clients(
+    session: Session,
+    user: Employee | None,
+    path: str,
+    file_format: str | None = None,
+    chunk_size: int = 10000,
+):
+    """Export clients"""
+    columns = exported_columns(Client)
+    stmt = select(*columns).order_by(Client.id)
+    export_rows(session, stmt, columns, path, file_format, chunk_size)
+
+
+@export.command(name="contract")
+@contract_filter_options
+@export_options
+@authentification_required
+@specified_role_required([RoleEmployees.commercial])
+@pass_session
+def export_contracts(
+    session: Session,
+    user: Employee | None,
+    path: str,
+    file_format: str | None = None,
+    chunk_size: int = 10000,
+    **filters,
+):
+    """Export contracts, with the same filters as list-contracts
+
+    Only commercial team employees can perform this action."""
+    columns = exported_columns(Contract)
+    stmt = filter_contracts(select(*columns).order_by(Contract.id), **filters)
+    export_rows(session, stmt, columns, path, file_format, chunk_size)
+
+
+@export.command(name="event")
+@event_filter_options
+@export_options
+@authentification_required
+@specified_role_required([RoleEmployees.gestion, RoleEmployees.support])
+@pass_session
+def export_events(
+    session: Session,
+    user: Employee | None,
+    path: str,
+    file_format: str | None = None,
+    chunk_size: int = 10000,
+    **filters,
+):
+    """Export events, with the same filters as list-events
+
+    Only gestion and support team employees can perform this action."""
+    columns = exported_columns(Event)
+    stmt = filter_events(select(*columns).order_by(Event.id), user, **filters)
+    export_rows(session, stmt, columns, path, file_format, chunk_size)
@@ -2,6 +2,7 @@ from datetime import datetime
 from typing import Optional
 
 import click
+from sqlalchemy import func, or_, select
 from sqlalchemy.orm.session import Session
 
 from controllers.auth import authentification_required, specified_role_required
@@ -9,8 +10,9 @@ from data_validation import ObjectByIDParamType
 from data_validation import click_validation as cval
 from data_validation import email_validation
 from models import Client, Employee, RoleEmployees
-from tools import pass_session
-from views.lists import print_object_details
+from sql_functions import greatest, trigram_match
+from tools import format_option, pass_session
+from views.lists import print_list_objects, print_objects_details
 from views.messages import print_messages, msg_unautorized_action
 
 client_group = click.Group()
@@ -19,15 +21,78 @@ client_group = click.Group()
 @client_group.command()
 @click.option(
     "-id",
-    "client",
-    help="Client's identifiant. Must be an integer linked to a client.",
+    "clients",
+    help="Clients' identifiants. Integers or ranges like '12,15,40-60'.",
     required=True,
-    prompt="Client's id",
-    type=ObjectByIDParamType(Client),
+    prompt="Clients' ids",
+    type=ObjectByIDParamType(Client, multiple_ids=True),
+)
+@format_option
+def display_client(clients: list[Client], output_format: str = "table"):
+    """Display any client
+
+    Several clients can be displayed at once."""
+    print_objects_details(clients, output_format)
+
+
+SEARCHED_COLUMNS = [
+    Client.firstname,
+    Client.lastname,
+    Client.society_name,
+    Client.email,
+]
+
+
+@client_group.command()
+@click.argument("query")
+@click.option(
+    "--limit",
+    "-li",
+    "limit",
+    help="Maximum number of clients to list.",
+    default=20,
+    show_default=True,
+    type=click.IntRange(min=1),
 )
-def display_client(client: Client):
-    """Display any client"""
-    print_object_details(client)
+@format_option
+@authentification_required
+@pass_session
+def search_clients(
+    session: Session,
+    user: Optional[Employee],
+    query: str,
+    limit: int = 20,
+    output_format: str = "table",
+):
+    """Search clients by name, society or email, tolerating typos
+
+    Clients are ranked by trigram similarity of their closest field to QUERY.
+    Only clients with a field similar enough (pg_trgm.similarity_threshold)
+    are listed, they are found through trigram indexes."""
+    score = greatest(
+        *(func.similarity(column, query) for column in SEARCHED_COLUMNS)
+    ).label("score")
+    stmt = (
+        select(
+            Client.id,
+            Client.fullname.label("fullname"),
+            Client.society_name,
+            Client.email,
+            score,
+        )
+        .where(or_(*(trigram_match(column, query) for column in SEARCHED_COLUMNS)))
+        .order_by(score.desc(), Client.id)
+        .limit(limit)
+    )
+
+    print_list_objects(
+        session.execute(stmt).mappings(),
+        ["id", "fullname", "society_name", "email", "score"],
+        title=f"Clients proches de « {query} »",
+        headers=["ID client", "Nom", "Société", "Email", "Score"],
+        formatters={"score": ".2f"},
+        output_format=output_format,
+    )
 
 
 @client_group.command()
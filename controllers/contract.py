@@ -2,14 +2,24 @@ from datetime import datetime
 from typing import Optional
 
 import click
-from sqlalchemy import select
+from sqlalchemy import Select, select, update
 from sqlalchemy.orm.session import Session
 
 from controllers.auth import authentification_required, specified_role_required
 from data_validation import EnumClassParamType, ObjectByIDParamType
 from models import Client, Contract, ContractStatus, Employee, Event, RoleEmployees
-from tools import pass_session
-from views.lists import print_list_objects, print_object_details
+from tools import (
+    BULK_PREVIEW_SIZE,
+    STREAM_CHUNK_SIZE,
+    count_rows,
+    dry_run_option,
+    fetch_list,
+    format_option,
+    list_options,
+    pass_session,
+    project,
+)
+from views.lists import print_list_objects, print_objects_details
 from views.messages import msg_unautorized_action
 
 contract_group = click.Group()
@@ -18,15 +28,18 @@ contract_group = click.Group()
 @contract_group.command()
 @click.option(
     "-id",
-    "contract",
-    help="Contract's identifiant. Must be an integer linked to a contract.",
+    "contracts",
+    help="Contracts' identifiants. Integers or ranges like '12,15,40-60'.",
     required=True,
-    prompt="Contract's id",
-    type=ObjectByIDParamType(Contract),
+    prompt="Contracts' ids",
+    type=ObjectByIDParamType(Contract, multiple_ids=True),
 )
-def display_contract(contract: Contract):
-    """Display any contrat"""
-    print_object_details(contract)
+@format_option
+def display_contract(contracts: list[Contract], output_format: str = "table"):
+    """Display any contrat
+
+    Several contracts can be displayed at once."""
+    print_objects_details(contracts, output_format)
 
 
 @contract_group.command()
@@ -95,7 +108,7 @@ def create_contract(
     help="Identifiant of the client. Must be an integer linked to a contract.",
     required=True,
     prompt="Contract's id",
-    type=ObjectByIDParamType(Contract),
+    type=ObjectByIDParamType(Contract, eager_load=["client.commercial_employee_id"]),
 )
 @click.option(
     "--total-amount",
@@ -159,49 +172,94 @@ def update_contract(
     click.echo(f"Contrat mis à jour. Status={updating_contract.status.name}")
 
 
+def contract_filter_options(function):
+    """Add options to filter contracts, used by list, export and bulk update
+    commands"""
+    function = click.option(
+        "--status",
+        "-st",
+        "filter_status",
+        help="Contract status to filter by.",
+        prompt_required=False,
+        prompt="Contract's status",
+        type=EnumClassParamType(ContractStatus),
+    )(function)
+    function = click.option(
+        "--not-signed",
+        "filter_not_signed",
+        help="Filter contracts wich are not already signed.",
+        is_flag=True,
+    )(function)
+    function = click.option(
+        "--before",
+        "-bf",
+        "filter_before",
+        help="Date before wich contract has been created. Format is '25/02/2000'",
+        prompt_required=False,
+        prompt="End of period to look at",
+        type=click.DateTime(formats=["%d/%m/%Y"]),
+    )(function)
+    function = click.option(
+        "--after",
+        "-af",
+        "filter_after",
+        help="Date after wich contract has been created. Format is '25/02/2000'",
+        prompt_required=False,
+        prompt="Start of period to look at",
+        type=click.DateTime(formats=["%d/%m/%Y"]),
+    )(function)
+    function = click.option(
+        "--event",
+        "-ev",
+        "filter_event",
+        help="Event id to filter by. Must be an integer linked to an event.",
+        prompt_required=False,
+        prompt="Event's id",
+        type=ObjectByIDParamType(Event),
+    )(function)
+    function = click.option(
+        "--client",
+        "-cl",
+        "filter_client",
+        help="Client id to filter by. Must be an integer linked to a client.",
+        prompt_required=False,
+        prompt="Client's id",
+        type=ObjectByIDParamType(Client),
+    )(function)
+    return function
+
+
+def filter_contracts(
+    stmt: Select,
+    filter_client: Client | None = None,
+    filter_event: Event | None = None,
+    filter_after: datetime | None = None,
+    filter_before: datetime | None = None,
+    filter_not_signed: bool = False,
+    filter_status: ContractStatus | None = None,
+) -> Select:
+    """Add to stmt where clauses according to contract filters
+
+    stmt may also be an update statement."""
+    if filter_client is not None:
+        stmt = stmt.where(Contract.client == filter_client)
+    if filter_event is not None:
+        stmt = stmt.where(Contract.associated_event == filter_event)
+    if filter_after is not None:
+        stmt = stmt.where(Contract.created_date > filter_after)
+    if filter_before is not None:
+        stmt = stmt.where(Contract.created_date < filter_before)
+    if filter_not_signed:
+        stmt = stmt.where(Contract.status != ContractStatus.signed)
+    if filter_status is not None:
+        stmt = stmt.where(Contract.status == filter_status)
+    return stmt
+
+
 @contract_group.command()
-@click.option(
-    "--client",
-    "-cl",
-    "filter_client",
-    help="Client id to filter by. Must be an integer linked to a client.",
-    prompt_required=False,
-    prompt="Client's id",
-    type=ObjectByIDParamType(Client),
-)
-@click.option(
-    "--event",
-    "-ev",
-    "filter_event",
-    help="Event id to filter by. Must be an integer linked to an event.",
-    prompt_required=False,
-    prompt="Event's id",
-    type=ObjectByIDParamType(Event),
-)
-@click.option(
-    "--after",
-    "-af",
-    "filter_after",
-    help="Date after wich contract has been created. Format is '25/02/2000'",
-    prompt_required=False,
-    prompt="Start of period to look at",
-    type=click.DateTime(formats=["%d/%m/%Y"]),
-)
-@click.option(
-    "--before",
-    "-bf",
-    "filter_before",
-    help="Date before wich contract has been created. Format is '25/02/2000'",
-    prompt_required=False,
-    prompt="End of period to look at",
-    type=click.DateTime(formats=["%d/%m/%Y"]),
-)
-@click.option(
-    "--not-signed",
-    "filter_not_signed",
-    help="Filter contracts wich are not already signed.",
-    is_flag=True,
-)
+@contract_filter_options
+@list_options
+@format_option
 @authentification_required
 @specified_role_required([RoleEmployees.commercial])
 @pass_session
@@ -213,36 +271,46 @@ def list_contracts(
     filter_after: datetime | None = None,
     filter_before: datetime | None = None,
     filter_not_signed: bool = False,
+    filter_status: ContractStatus | None = None,
+    page_size: int | None = None,
+    after_id: int | None = None,
+    stream: bool = False,
+    output_format: str = "table",
 ):
     """List details of contracts
 
     Only commercial team employees can perform this action."""
 
-    stmt = select(Contract)
-    if filter_client is not None:
-        stmt = stmt.where(Contract.client == filter_client)
-    if filter_event is not None:
-        stmt = stmt.where(Contract.associated_event == filter_event)
-    if filter_after is not None:
-        stmt = stmt.where(Contract.created_date > filter_after)
-    if filter_before is not None:
-        stmt = stmt.where(Contract.created_date < filter_before)
-    if filter_not_signed:
-        stmt = stmt.where(Contract.status != ContractStatus.signed)
+    list_attr = [
+        "id",
+        "created_date",
+        "client.fullname",
+        "total_amount",
+        "amount_to_pay",
+        "status.name",
+        "associated_event.id",
+    ]
 
-    contracts = session.scalars(stmt).all()
+    projection = project(Contract, list_attr)
+    stmt = filter_contracts(
+        projection.stmt,
+        filter_client,
+        filter_event,
+        filter_after,
+        filter_before,
+        filter_not_signed,
+        filter_status,
+    )
+
+    contracts = fetch_list(session, stmt, Contract, page_size, after_id, stream)
+
+    epilog = """Use "--help" to see avaible filters"""
+    if not stream and page_size is not None and len(contracts) == page_size:
+        epilog += f"""\nUse "--after-id {contracts[-1].id}" to see next page"""
 
     print_list_objects(
-        contracts,
-        [
-            "id",
-            "created_date",
-            "client.fullname",
-            "total_amount",
-            "amount_to_pay",
-            "status.name",
-            "associated_event.id",
-        ],
+        projection.rows(contracts),
+        list_attr,
         title="Liste des contrats",
         headers=[
             "ID contrat",
@@ -258,5 +326,89 @@ def list_contracts(
             "amount_to_pay": ".2f",
             "total_amount": ".2f",
         },
-        epilog="""Use "--help" to see avaible filters""",
+        epilog=epilog,
+        chunk_size=STREAM_CHUNK_SIZE if stream else None,
+        output_format=output_format,
+    )
+
+
+def updatable_contracts(stmt, user: Employee):
+    """Restrict stmt to contracts user can update, as in update_contract"""
+    if user.role == RoleEmployees.gestion:
+        return stmt
+    return stmt.where(Contract.client.has(Client.commercial_employee_id == user.id))
+
+
+@contract_group.command()
+@contract_filter_options
+@click.option(
+    "--set-status",
+    "-ss",
+    "new_status",
+    help="New status of the contracts.",
+    type=EnumClassParamType(ContractStatus),
+)
+@click.option(
+    "--set-remaining-amount",
+    "-sr",
+    "new_remaining_amount",
+    help="New remaining amount to pay of the contracts. Must be a number only.",
+    type=click.FLOAT,
+)
+@dry_run_option
+@authentification_required
+@specified_role_required([RoleEmployees.gestion, RoleEmployees.commercial])
+@pass_session
+def update_contracts(
+    session: Session,
+    user: Employee | None,
+    new_status: ContractStatus | None = None,
+    new_remaining_amount: float | None = None,
+    dry_run: bool = False,
+    **filters,
+):
+    """Modify every contract matching filters at once
+
+    Contracts are updated by a single statement, like archiving contracts
+    signed before a date with "--status signed --before 01/01/2023
+    --set-status archived". Commercials only update contracts of clients
+    they follow.
+
+    Only gestion team and commercial employees can perform this action."""
+    # Filters without effect are ignored too
+    if filter_contracts(select(Contract.id), **filters).whereclause is None:
+        raise click.UsageError("At least one filter is needed, see --help.")
+    new_values = {
+        key: value
+        for key, value in (
+            ("status", new_status),
+            ("amount_to_pay", new_remaining_amount),
+        )
+        if value is not None
+    }
+    if not new_values:
+        raise click.UsageError("Nothing to update, see --help.")
+
+    if dry_run:
+        list_attr = ["id", "created_date", "client.fullname", "status.name"]
+        projection = project(Contract, list_attr)
+        stmt = updatable_contracts(filter_contracts(projection.stmt, **filters), user)
+        count = count_rows(session, stmt)
+        print_list_objects(
+            projection.rows(
+                session.execute(stmt.order_by(Contract.id).limit(BULK_PREVIEW_SIZE))
+            ),
+            list_attr,
+            title="Contrats à modifier",
+            headers=["ID contrat", "Date de création", "Client", "Statut"],
+            formatters={"created_date": "%d/%m/%Y"},
+            epilog=f"{count} contract(s) would be updated, nothing changed.",
+        )
+        return
+
+    stmt = updatable_contracts(filter_contracts(update(Contract), **filters), user)
+    # No updated contract is loaded in session, nothing to synchronize
+    result = session.execute(
+        stmt.values(new_values), execution_options={"synchronize_session": False}
     )
+    click.echo(f"{result.rowcount} contrat(s) mis à jour.")
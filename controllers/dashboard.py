@@ -0,0 +1,89 @@
+from datetime import datetime
+
+import click
+from sqlalchemy.orm.session import Session
+
+from controllers.auth import authentification_required, specified_role_required
+from models import Client, Contract, ContractStatus, Employee, Event, RoleEmployees
+from tools import fetch_concurrently, pass_session, project
+from views.lists import print_list_objects
+
+dashboard_group = click.Group()
+
+
+@dashboard_group.command()
+@click.option(
+    "--limit",
+    "-li",
+    "limit",
+    help="Maximum number of objects listed in each part.",
+    default=20,
+    show_default=True,
+    type=click.IntRange(min=1),
+)
+@authentification_required
+@specified_role_required([RoleEmployees.commercial])
+@pass_session
+def dashboard(session: Session, user: Employee | None, limit: int = 20):
+    """Show your clients, open contracts and upcoming events
+
+    The three lists are independent reads, fetched concurrently when
+    DB_ASYNC setting is enabled.
+
+    Only commercial team employees can perform this action."""
+    is_user_client = Client.commercial_employee_id == user.id
+
+    clients = project(Client, ["id", "fullname", "society_name", "email"])
+    contracts = project(
+        Contract,
+        ["id", "client.fullname", "total_amount", "amount_to_pay", "status.name"],
+    )
+    events = project(
+        Event,
+        [
+            "id",
+            "datetime_start",
+            "location",
+            "contract.client.fullname",
+            "support_employee.username",
+        ],
+    )
+
+    client_rows, contract_rows, event_rows = fetch_concurrently(
+        session,
+        clients.stmt.where(is_user_client).order_by(Client.id).limit(limit),
+        contracts.stmt.where(
+            Contract.client.has(is_user_client),
+            (Contract.status != ContractStatus.signed) | (Contract.amount_to_pay > 0),
+        )
+        .order_by(Contract.created_date)
+        .limit(limit),
+        events.stmt.where(
+            Event.contract.has(Contract.client.has(is_user_client)),
+            Event.datetime_start >= datetime.now(),
+        )
+        .order_by(Event.datetime_start)
+        .limit(limit),
+    )
+
+    print_list_objects(
+        clients.rows(client_rows),
+        clients.list_attr,
+        title="Mes clients",
+        headers=["ID client", "Nom", "Société", "Email"],
+        formatters={},
+    )
+    print_list_objects(
+        contracts.rows(contract_rows),
+        contracts.list_attr,
+        title="Contrats non signés ou non soldés",
+        headers=["ID contrat", "Client", "Cout total", "Montant dû", "Statut"],
+        formatters={"total_amount": ".2f", "amount_to_pay": ".2f"},
+    )
+    print_list_objects(
+        events.rows(event_rows),
+        events.list_attr,
+        title="Événements à venir",
+        headers=["ID évént.", "Date début", "Lieu", "Client", "Employé support"],
+        formatters={"datetime_start": "%d/%m/%Y %H:%M"},
+    )
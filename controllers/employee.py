@@ -1,10 +1,13 @@
 from typing import Literal, Optional
 
 import click
-from passlib.hash import argon2
 from sqlalchemy.orm.session import Session
 
-from controllers.auth import authentification_required, specified_role_required
+from controllers.auth import (
+    authentification_required,
+    password_hasher,
+    specified_role_required,
+)
 from data_validation import EnumClassParamType, ObjectByIDParamType
 from data_validation import click_validation as cval
 from data_validation import username_validation
@@ -59,7 +62,7 @@ def create_employee(
     Only gestion team employees can perform this action."""
     new_employee = Employee(
         username=employee_username,
-        password=argon2.hash(employee_password),
+        password=password_hasher.hash(employee_password),
         role=employee_role,
     )
 
@@ -124,11 +127,13 @@ def update_employee(
     Only gestion team employees can perform this action."""
     new_values = {
         "username": employee_username,
-        "password": argon2.hash(employee_password)
+        "password": password_hasher.hash(employee_password)
         if employee_password is not None
         else None,
         "role": employee_role,
     }
+    if any(value is not None for value in new_values.values()):
+        new_values["auth_epoch"] = updating_employee.auth_epoch + 1
 
     updating_employee.merge_fromdict(new_values)
 
@@ -162,6 +167,7 @@ def deactivate_employee(
     Only gestion team employees can perform this action."""
 
     deleting_employee.password = ""
+    deleting_employee.auth_epoch += 1
     click.echo(
         f"Employé mis à jour : id={deleting_employee.id}, "
         f"username={deleting_employee.username}, hash={deleting_employee.password}"
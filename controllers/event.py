@@ -1,8 +1,12 @@
+import heapq
+from bisect import bisect_left
 from datetime import datetime
+from itertools import accumulate
 from typing import Optional
 
 import click
-from sqlalchemy import select
+from sqlalchemy import Select, exists, or_, select, update
+from sqlalchemy.orm import aliased
 from sqlalchemy.orm.session import Session
 from sqlalchemy.sql import null
 
@@ -11,9 +15,20 @@ from data_validation import ObjectByIDParamType
 from data_validation import click_validation as cval
 from data_validation import role_support_validation
 from models import Contract, Employee, Event, RoleEmployees, ContractStatus, Client
-from tools import pass_session
-from views.lists import print_list_objects, print_object_details
+from tools import (
+    BULK_PREVIEW_SIZE,
+    STREAM_CHUNK_SIZE,
+    count_rows,
+    dry_run_option,
+    fetch_list,
+    format_option,
+    list_options,
+    pass_session,
+    project,
+)
+from views.lists import print_list_objects, print_objects_details
 from views.messages import msg_unautorized_action
+from views.messages import print_messages as mprint
 
 event_group = click.Group()
 
@@ -21,51 +36,86 @@ event_group = click.Group()
 @event_group.command()
 @click.option(
     "-id",
-    "event",
-    help="Event's identifiant. Must be an integer linked to an event.",
+    "events",
+    help="Events' identifiants. Integers or ranges like '12,15,40-60'.",
     required=True,
-    prompt="Event's id",
-    type=ObjectByIDParamType(Event),
+    prompt="Events' ids",
+    type=ObjectByIDParamType(Event, multiple_ids=True),
 )
-def display_event(event: Event):
-    """Display any event"""
-    print_object_details(event)
+@format_option
+def display_event(events: list[Event], output_format: str = "table"):
+    """Display any event
+
+    Several events can be displayed at once."""
+    print_objects_details(events, output_format)
+
+
+def event_filter_options(function):
+    """Add options to filter events, used by list, export and bulk update
+    commands"""
+    function = click.option(
+        "--followed-events",
+        "filter_user_as_support",
+        help="Filter events with actual user as support employee associated."
+        " Not used if an other employee filter is used as the same time."
+        " Restrained to support employees, no effect otherwise.",
+        is_flag=True,
+    )(function)
+    function = click.option(
+        "--no-support",
+        "filter_no_support",
+        help="Filter events without support employee associated."
+        " Not used if employee filter used as the same time.",
+        is_flag=True,
+    )(function)
+    function = click.option(
+        "--employee",
+        "-em",
+        "filter_employee",
+        help="Support employee id to filter by. Must be an integer linked to an employee.",
+        prompt_required=False,
+        prompt="Employee's id",
+        type=ObjectByIDParamType(Employee),
+    )(function)
+    function = click.option(
+        "--contract",
+        "-co",
+        "filter_contract",
+        help="Contract id to filter by. Must be an integer linked to a contract.",
+        prompt_required=False,
+        prompt="Contract's id",
+        type=ObjectByIDParamType(Contract),
+    )(function)
+    return function
+
+
+def filter_events(
+    stmt: Select,
+    user: Employee,
+    filter_contract: Contract | None = None,
+    filter_employee: Employee | None = None,
+    filter_no_support: bool = False,
+    filter_user_as_support: bool = False,
+) -> Select:
+    """Add to stmt where clauses according to event filters
+
+    stmt may also be an update statement."""
+    if filter_contract is not None:
+        stmt = stmt.where(Event.contract == filter_contract)
+
+    if filter_employee is not None:
+        stmt = stmt.where(Event.support_employee == filter_employee)
+    elif filter_no_support:
+        stmt = stmt.where(Event.support_employee == null())
+    elif filter_user_as_support and user.role == RoleEmployees.support:
+        stmt = stmt.where(Event.support_employee == user)
+    return stmt
 
 
 @event_group.command()
-@click.option(
-    "--contract",
-    "-co",
-    "filter_contract",
-    help="Contract id to filter by. Must be an integer linked to a contract.",
-    prompt_required=False,
-    prompt="Contract's id",
-    type=ObjectByIDParamType(Contract),
-)
-@click.option(
-    "--employee",
-    "-em",
-    "filter_employee",
-    help="Support employee id to filter by. Must be an integer linked to an employee.",
-    prompt_required=False,
-    prompt="Employee's id",
-    type=ObjectByIDParamType(Employee),
-)
-@click.option(
-    "--no-support",
-    "filter_no_support",
-    help="Filter events without support employee associated."
-    " Not used if employee filter used as the same time.",
-    is_flag=True,
-)
-@click.option(
-    "--followed-events",
-    "filter_user_as_support",
-    help="Filter events with actual user as support employee associated."
-    " Not used if an other employee filter is used as the same time."
-    " Restrained to support employees, no effect otherwise.",
-    is_flag=True,
-)
+@event_filter_options
+@list_options
+@format_option
 @authentification_required
 @specified_role_required([RoleEmployees.gestion, RoleEmployees.support])
 @pass_session
@@ -76,36 +126,45 @@ def list_events(
     filter_employee: Employee | None = None,
     filter_no_support: bool = False,
     filter_user_as_support: bool = False,
+    page_size: int | None = None,
+    after_id: int | None = None,
+    stream: bool = False,
+    output_format: str = "table",
 ):
     """List details of events
 
     Only gestion and support team employees can perform this action."""
 
-    stmt = select(Event)
-    if filter_contract is not None:
-        stmt = stmt.where(Event.contract == filter_contract)
+    list_attr = [
+        "id",
+        "contrat_id",
+        "datetime_start",
+        "datetime_end",
+        "location",
+        "support_employee.username",
+        "attendees",
+        "notes",
+    ]
 
-    if filter_employee is not None:
-        stmt = stmt.where(Event.support_employee == filter_employee)
-    elif filter_no_support:
-        stmt = stmt.where(Event.support_employee == null())
-    elif filter_user_as_support and user.role == RoleEmployees.support:
-        stmt = stmt.where(Event.support_employee == user)
+    projection = project(Event, list_attr)
+    stmt = filter_events(
+        projection.stmt,
+        user,
+        filter_contract,
+        filter_employee,
+        filter_no_support,
+        filter_user_as_support,
+    )
+
+    events = fetch_list(session, stmt, Event, page_size, after_id, stream)
 
-    events = session.scalars(stmt).all()
+    epilog = """Use "--help" to see avaible filters"""
+    if not stream and page_size is not None and len(events) == page_size:
+        epilog += f"""\nUse "--after-id {events[-1].id}" to see next page"""
 
     print_list_objects(
-        events,
-        [
-            "id",
-            "contrat_id",
-            "datetime_start",
-            "datetime_end",
-            "location",
-            "support_employee.username",
-            "attendees",
-            "notes",
-        ],
+        projection.rows(events),
+        list_attr,
         title="Liste des contrats",
         headers=[
             "ID évént.",
@@ -121,10 +180,27 @@ def list_events(
             "datetime_start": "%d/%m/%Y",
             "datetime_end": "%d/%m/%Y",
         },
-        epilog="""Use "--help" to see avaible filters""",
+        epilog=epilog,
+        chunk_size=STREAM_CHUNK_SIZE if stream else None,
+        output_format=output_format,
     )
 
 
+def support_conflicts(session: Session, employee: Employee, event: Event) -> list[int]:
+    """Return ids of other events supported by employee, overlapping event"""
+    if event.datetime_start is None or event.datetime_end is None:
+        return []
+    return session.scalars(
+        select(Event.id)
+        .where(
+            Event.support_employee_id == employee.id,
+            Event.id != event.id,
+            Event.overlaps(event.datetime_start, event.datetime_end),
+        )
+        .order_by(Event.id)
+    ).all()
+
+
 @event_group.command()
 @click.option(
     "--event",
@@ -145,6 +221,12 @@ def list_events(
     type=ObjectByIDParamType(Employee),
     callback=cval(role_support_validation),
 )
+@click.option(
+    "--allow-conflict",
+    "allow_conflict",
+    help="Attach the employee even if already supporting another event meanwhile.",
+    is_flag=True,
+)
 @authentification_required
 @specified_role_required([RoleEmployees.gestion])
 @pass_session
@@ -153,10 +235,23 @@ def add_event_support(
     user: Employee | None,
     updating_event: Event,
     support_employee: Employee,
+    allow_conflict: bool = False,
 ):
     """Attach a support employee to an event
 
+    The employee isn't attached if already supporting an event overlapping
+    this one, unless "--allow-conflict" is used.
+
     Only gestion team employees can perform this action."""
+    conflicts = support_conflicts(session, support_employee, updating_event)
+    if conflicts and not allow_conflict:
+        mprint(
+            f"Employee id={support_employee.id} already supports event(s) "
+            f"id={', '.join(str(id) for id in conflicts)} meanwhile.",
+            level="warning",
+        )
+        return
+
     updating_event.support_employee = support_employee
 
     click.echo(
@@ -174,7 +269,7 @@ def add_event_support(
     "Must be an integer linked to a contract.",
     required=True,
     prompt="Contract's id",
-    type=ObjectByIDParamType(Contract),
+    type=ObjectByIDParamType(Contract, eager_load=["client.commercial_employee_id"]),
 )
 @click.option(
     "--date-start",
@@ -242,6 +337,8 @@ def create_event(
     ):
         msg_unautorized_action()
         click.Abort()
+    if datetime_end < datetime_start:
+        raise click.UsageError("Event can't end before it starts.")
 
     new_event = Event(
         contract=event_contract,
@@ -338,6 +435,393 @@ def update_event(
         "attendees": number_attendees,
         "notes": event_notes,
     }
+    # Checked before changing the event, which is committed even on errors
+    new_start = datetime_start or updating_event.datetime_start
+    new_end = datetime_end or updating_event.datetime_end
+    if new_start is not None and new_end is not None and new_end < new_start:
+        raise click.UsageError("Event can't end before it starts.")
     updating_event.merge_fromdict(new_values)
 
+    if conflicts := support_conflicts(session, user, updating_event):
+        mprint(
+            f"You already support event(s) id={', '.join(str(id) for id in conflicts)}"
+            " meanwhile.",
+            level="warning",
+        )
     click.echo("Événement mis à jour.")
+
+
+@event_group.command()
+@click.option(
+    "--event",
+    "-ev",
+    "for_event",
+    help="Event to find support for. Must be an integer linked to a event.",
+    type=ObjectByIDParamType(Event),
+)
+@click.option(
+    "--date-start",
+    "-ds",
+    "datetime_start",
+    help="Start of the period, if no event is given. Format is '25/02/2000 16:50'",
+    type=click.DateTime(formats=["%d/%m/%Y %H:%M"]),
+)
+@click.option(
+    "--date-end",
+    "-de",
+    "datetime_end",
+    help="End of the period, if no event is given. Format is '25/02/2000 16:50'",
+    type=click.DateTime(formats=["%d/%m/%Y %H:%M"]),
+)
+@format_option
+@authentification_required
+@specified_role_required([RoleEmployees.gestion])
+@pass_session
+def find_available_support(
+    session: Session,
+    user: Employee | None,
+    for_event: Event | None = None,
+    datetime_start: datetime | None = None,
+    datetime_end: datetime | None = None,
+    output_format: str = "table",
+):
+    """List support employees free during an event or a period
+
+    Only gestion team employees can perform this action."""
+    if for_event is not None:
+        datetime_start, datetime_end = for_event.datetime_start, for_event.datetime_end
+    if datetime_start is None or datetime_end is None or datetime_end <= datetime_start:
+        raise click.UsageError(
+            "Give an event with dates, or a period (start before end)."
+        )
+
+    busy = exists().where(
+        Event.support_employee_id == Employee.id,
+        Event.overlaps(datetime_start, datetime_end),
+    )
+    if for_event is not None:
+        busy = busy.where(Event.id != for_event.id)
+    stmt = (
+        select(Employee.id, Employee.username)
+        .where(
+            Employee.role == RoleEmployees.support,
+            # Deactivated employees have no password
+            Employee.password != "",
+            ~busy,
+        )
+        .order_by(Employee.username)
+    )
+
+    print_list_objects(
+        session.execute(stmt).mappings(),
+        ["id", "username"],
+        title=f"Support disponible du {datetime_start:%d/%m/%Y %H:%M} "
+        f"au {datetime_end:%d/%m/%Y %H:%M}",
+        headers=["ID employé", "Nom d'utilisateur"],
+        formatters={},
+        output_format=output_format,
+    )
+
+
+def updatable_events(stmt, user: Employee):
+    """Restrict stmt to events user can update, as in update_event"""
+    if user.role == RoleEmployees.support:
+        return stmt.where(Event.support_employee_id == user.id)
+    return stmt
+
+
+def bulk_support_conflicts(
+    session: Session, employee: Employee, events: Select
+) -> list[int]:
+    """Return ids of events selected by events (ids) which would overlap
+    another event of employee, if all of them were attached to employee"""
+    events = events.correlate(None)
+    other = aliased(Event)
+    return session.scalars(
+        select(Event.id)
+        .where(
+            Event.id.in_(events),
+            exists().where(
+                other.id != Event.id,
+                or_(other.support_employee_id == employee.id, other.id.in_(events)),
+                other.overlaps(Event.datetime_start, Event.datetime_end),
+            ),
+        )
+        .order_by(Event.id)
+    ).all()
+
+
+@event_group.command()
+@event_filter_options
+@click.option(
+    "--set-support",
+    "-ss",
+    "new_support",
+    help="Identifiant of the new support employee of the events (gestion team).",
+    type=ObjectByIDParamType(Employee),
+    callback=cval(role_support_validation),
+)
+@click.option(
+    "--set-location",
+    "-sl",
+    "new_location",
+    help="New location of the events (support team).",
+)
+@click.option(
+    "--set-notes",
+    "-sn",
+    "new_notes",
+    help="New notes about the events (support team).",
+)
+@click.option(
+    "--allow-conflict",
+    "allow_conflict",
+    help="Attach the support employee even if events would overlap.",
+    is_flag=True,
+)
+@dry_run_option
+@authentification_required
+@specified_role_required([RoleEmployees.gestion, RoleEmployees.support])
+@pass_session
+def update_events(
+    session: Session,
+    user: Employee | None,
+    new_support: Employee | None = None,
+    new_location: str | None = None,
+    new_notes: str | None = None,
+    allow_conflict: bool = False,
+    dry_run: bool = False,
+    **filters,
+):
+    """Modify every event matching filters at once
+
+    Events are updated by a single statement, like reassigning all events of
+    a support employee with "--employee 12 --set-support 15". The new support
+    employee isn't attached if events would overlap, unless "--allow-conflict"
+    is used. Support employees only update events they support.
+
+    Only gestion team employees can change support employee, and support
+    team employees other values."""
+    # Like "--followed-events" for gestion, which has no effect
+    if filter_events(select(Event.id), user, **filters).whereclause is None:
+        raise click.UsageError("At least one filter is needed, see --help.")
+    new_values = {
+        key: value
+        for key, value in (
+            ("support_employee_id", new_support.id if new_support else None),
+            ("location", new_location),
+            ("notes", new_notes),
+        )
+        if value is not None
+    }
+    if not new_values:
+        raise click.UsageError("Nothing to update, see --help.")
+    if (new_support is not None and user.role != RoleEmployees.gestion) or (
+        (new_location is not None or new_notes is not None)
+        and user.role != RoleEmployees.support
+    ):
+        msg_unautorized_action()
+        raise click.Abort()
+
+    if new_support is not None:
+        events = updatable_events(
+            filter_events(select(Event.id), user, **filters), user
+        )
+        if conflicts := bulk_support_conflicts(session, new_support, events):
+            mprint(
+                f"Event(s) id={', '.join(str(id) for id in conflicts)} would "
+                f"overlap another event of employee id={new_support.id}.",
+                level="warning",
+            )
+            if not allow_conflict and not dry_run:
+                return
+
+    if dry_run:
+        list_attr = [
+            "id",
+            "datetime_start",
+            "location",
+            "support_employee.username",
+        ]
+        projection = project(Event, list_attr)
+        stmt = updatable_events(filter_events(projection.stmt, user, **filters), user)
+        count = count_rows(session, stmt)
+        print_list_objects(
+            projection.rows(
+                session.execute(stmt.order_by(Event.id).limit(BULK_PREVIEW_SIZE))
+            ),
+            list_attr,
+            title="Événements à modifier",
+            headers=["ID évént.", "Date début", "Lieu", "Employé support"],
+            formatters={"datetime_start": "%d/%m/%Y %H:%M"},
+            epilog=f"{count} event(s) would be updated, nothing changed.",
+        )
+        return
+
+    stmt = updatable_events(filter_events(update(Event), user, **filters), user)
+    # No updated event is loaded in session, nothing to synchronize
+    result = session.execute(
+        stmt.values(new_values), execution_options={"synchronize_session": False}
+    )
+    click.echo(f"{result.rowcount} événement(s) mis à jour.")
+
+
+class BookedPeriods:
+    """Periods of events already supported by an employee, sorted by start"""
+
+    def __init__(self, periods: list[tuple[datetime, datetime]]):
+        self.starts = [start for start, _ in periods]
+        # Latest end among periods starting at this index or before
+        self.max_ends = list(accumulate((end for _, end in periods), max))
+
+    def overlap(self, datetime_start: datetime, datetime_end: datetime) -> bool:
+        """Whether a period overlaps [datetime_start, datetime_end)"""
+        # Periods starting before the end, one of them ends after the start
+        index = bisect_left(self.starts, datetime_end)
+        return index > 0 and self.max_ends[index - 1] > datetime_start
+
+
+def schedule_support(
+    events: list[tuple[int, datetime, datetime]],
+    workloads: dict[int, float],
+    booked: dict[int, BookedPeriods],
+) -> tuple[dict[int, int], list[int]]:
+    """Assign events (id, start, end), sorted by start, to support employees
+
+    The timeline is swept with two priority queues: employees busy with an
+    assigned event until its end, and free employees by workload (hours).
+    Each event goes to the least loaded free employee whose booked periods
+    don't overlap it, and adds its duration to the employee's workload.
+    Return {event id: employee id} and ids of events nobody is free for."""
+    free = [(workload, employee_id) for employee_id, workload in workloads.items()]
+    heapq.heapify(free)
+    busy = []
+    assignments, unassigned = {}, []
+
+    for event_id, datetime_start, datetime_end in events:
+        while busy and busy[0][0] <= datetime_start:
+            _, employee_id = heapq.heappop(busy)
+            heapq.heappush(free, (workloads[employee_id], employee_id))
+
+        chosen, skipped = None, []
+        while free and chosen is None:
+            workload, employee_id = heapq.heappop(free)
+            if booked[employee_id].overlap(datetime_start, datetime_end):
+                skipped.append((workload, employee_id))
+            else:
+                chosen = employee_id
+        for item in skipped:
+            heapq.heappush(free, item)
+
+        if chosen is None:
+            unassigned.append(event_id)
+            continue
+        assignments[event_id] = chosen
+        workloads[chosen] += (datetime_end - datetime_start).total_seconds() / 3600
+        heapq.heappush(busy, (datetime_end, chosen))
+
+    return assignments, unassigned
+
+
+@event_group.command()
+@dry_run_option
+@authentification_required
+@specified_role_required([RoleEmployees.gestion])
+@pass_session
+def auto_assign_support(session: Session, user: Employee | None, dry_run: bool = False):
+    """Attach support employees to every event without one
+
+    Events are assigned in one pass over their timeline, to the support
+    employee with the lowest workload (hours of events supported meanwhile)
+    who doesn't support another event at the same time. Events without
+    dates, or during which no employee is free, stay without support.
+
+    Only gestion team employees can perform this action."""
+    events = session.execute(
+        select(Event.id, Event.datetime_start, Event.datetime_end)
+        .where(
+            Event.support_employee_id.is_(None),
+            Event.datetime_start.is_not(None),
+            Event.datetime_end.is_not(None),
+        )
+        .order_by(Event.datetime_start, Event.id)
+        # Events being assigned meanwhile by another command are left out
+        .with_for_update(skip_locked=True)
+    ).all()
+    if not events:
+        mprint("Every event with dates already has a support employee.")
+        return
+
+    supports = dict(
+        session.execute(
+            select(Employee.id, Employee.username).where(
+                Employee.role == RoleEmployees.support,
+                # Deactivated employees have no password
+                Employee.password != "",
+            )
+        ).all()
+    )
+    if not supports:
+        mprint("There is no active support employee.", level="warning")
+        return
+    periods = {employee_id: [] for employee_id in supports}
+    workloads = dict.fromkeys(supports, 0.0)
+    for employee_id, datetime_start, datetime_end in session.execute(
+        select(Event.support_employee_id, Event.datetime_start, Event.datetime_end)
+        .where(
+            Event.support_employee_id.in_(supports),
+            # Periods with a missing bound can't be booked nor measured
+            Event.datetime_start.is_not(None),
+            Event.datetime_end.is_not(None),
+            Event.overlaps(events[0].datetime_start, max(end for _, _, end in events)),
+        )
+        .order_by(Event.datetime_start)
+    ):
+        periods[employee_id].append((datetime_start, datetime_end))
+        workloads[employee_id] += (datetime_end - datetime_start).total_seconds() / 3600
+    workloads_before = dict(workloads)
+
+    assignments, unassigned = schedule_support(
+        events,
+        workloads,
+        {employee_id: BookedPeriods(periods[employee_id]) for employee_id in supports},
+    )
+
+    if assignments and not dry_run:
+        # Bulk update by primary key, in batches of executemany
+        session.execute(
+            update(Event),
+            [
+                {"id": event_id, "support_employee_id": employee_id}
+                for event_id, employee_id in assignments.items()
+            ],
+        )
+
+    assigned_counts = dict.fromkeys(supports, 0)
+    for employee_id in assignments.values():
+        assigned_counts[employee_id] += 1
+    print_list_objects(
+        [
+            {
+                "id": employee_id,
+                "username": username,
+                "assigned": assigned_counts[employee_id],
+                "workload_before": workloads_before[employee_id],
+                "workload": workloads[employee_id],
+            }
+            for employee_id, username in sorted(supports.items(), key=lambda i: i[1])
+        ],
+        ["id", "username", "assigned", "workload_before", "workload"],
+        title="Affectation automatique du support",
+        headers=[
+            "ID employé",
+            "Nom d'utilisateur",
+            "Événements affectés",
+            "Charge avant (h)",
+            "Charge après (h)",
+        ],
+        formatters={"workload_before": ".1f", "workload": ".1f"},
+        epilog=f"{len(assignments)} event(s) assigned, {len(unassigned)} left "
+        "without support (nobody free meanwhile)."
+        + (" Nothing changed (dry run)." if dry_run else ""),
+    )
@@ -0,0 +1,295 @@
+from datetime import datetime
+
+import click
+from sqlalchemy import (
+    Float,
+    Integer,
+    Select,
+    case,
+    cast,
+    column,
+    extract,
+    func,
+    select,
+    table,
+    text,
+)
+from sqlalchemy.orm.session import Session
+
+from controllers.auth import authentification_required, specified_role_required
+from data_validation import ObjectByIDParamType
+from models import Client, Contract, ContractStatus, Employee, RoleEmployees
+from tools import format_option, pass_session
+from views.lists import print_list_objects
+from views.messages import print_messages as mprint
+
+report_group = click.Group()
+
+# Materialized view created by migration 5b8e0c1f7a92, one row per commercial
+# and month. It has the same columns as monthly_aggregates() below.
+contract_monthly_report = table(
+    "contract_monthly_report",
+    column("commercial_employee_id", Integer),
+    column("year", Integer),
+    column("month", Integer),
+    column("contract_count", Integer),
+    column("signed_count", Integer),
+    column("signed_revenue", Float),
+    column("outstanding_amount", Float),
+)
+
+
+def monthly_aggregates():
+    """Return contracts aggregated per commercial and month, from the tables"""
+    is_signed = Contract.status == ContractStatus.signed
+    year = cast(extract("year", Contract.created_date), Integer)
+    month = cast(extract("month", Contract.created_date), Integer)
+    return (
+        select(
+            Client.commercial_employee_id.label("commercial_employee_id"),
+            year.label("year"),
+            month.label("month"),
+            func.count(Contract.id).label("contract_count"),
+            func.count(case((is_signed, Contract.id))).label("signed_count"),
+            func.coalesce(func.sum(case((is_signed, Contract.total_amount))), 0).label(
+                "signed_revenue"
+            ),
+            func.coalesce(func.sum(case((is_signed, Contract.amount_to_pay))), 0).label(
+                "outstanding_amount"
+            ),
+        )
+        .join(Contract.client)
+        .group_by(Client.commercial_employee_id, year, month)
+        .subquery("monthly_aggregates")
+    )
+
+
+def has_materialized_view(session: Session) -> bool:
+    """Whether the database has contract_monthly_report, only PostgreSQL does"""
+    return session.get_bind().dialect.name == "postgresql"
+
+
+def report_source(session: Session, live: bool):
+    if live or not has_materialized_view(session):
+        return monthly_aggregates()
+    return contract_monthly_report
+
+
+def filter_period(
+    stmt: Select,
+    source,
+    period_from: datetime | None = None,
+    period_to: datetime | None = None,
+) -> Select:
+    period = source.c.year * 100 + source.c.month
+    if period_from:
+        stmt = stmt.where(period >= period_from.year * 100 + period_from.month)
+    if period_to:
+        stmt = stmt.where(period <= period_to.year * 100 + period_to.month)
+    return stmt
+
+
+def report_options(function):
+    """Add period, source and output format options to a report command"""
+    function = format_option(function)
+    function = click.option(
+        "--live",
+        "live",
+        help="Compute from contracts instead of the materialized view "
+        '(refreshed by "report refresh"). Always the case with SQLite.',
+        is_flag=True,
+    )(function)
+    function = click.option(
+        "--to",
+        "period_to",
+        help="Last month of the period. Format is '12/2023'",
+        type=click.DateTime(formats=["%m/%Y"]),
+    )(function)
+    function = click.option(
+        "--from",
+        "period_from",
+        help="First month of the period. Format is '01/2023'",
+        type=click.DateTime(formats=["%m/%Y"]),
+    )(function)
+    return function
+
+
+@report_group.group()
+def report():
+    """Report revenue, outstanding amounts and contracts counts
+
+    Reports read the contract_monthly_report materialized view, so they
+    don't depend on the number of contracts. It is only as recent as its
+    last refresh, use "--live" to compute from contracts."""
+
+
+@report.command(name="monthly")
+@click.option(
+    "-co",
+    "--commercial",
+    "filter_commercial",
+    help="Commercial employee id to filter by.",
+    type=ObjectByIDParamType(Employee),
+)
+@report_options
+@authentification_required
+@specified_role_required([RoleEmployees.gestion])
+@pass_session
+def report_monthly(
+    session: Session,
+    user: Employee | None,
+    filter_commercial: Employee | None = None,
+    period_from: datetime | None = None,
+    period_to: datetime | None = None,
+    live: bool = False,
+    output_format: str = "table",
+):
+    """Report per commercial and month, with running signed revenue
+
+    Only gestion team employees can perform this action."""
+    source = report_source(session, live)
+    stmt = (
+        select(
+            Employee.username.label("commercial"),
+            source.c.year,
+            source.c.month,
+            source.c.contract_count,
+            source.c.signed_count,
+            source.c.signed_revenue,
+            source.c.outstanding_amount,
+            func.sum(source.c.signed_revenue)
+            .over(
+                partition_by=source.c.commercial_employee_id,
+                order_by=(source.c.year, source.c.month),
+            )
+            .label("cumulative_revenue"),
+        )
+        .select_from(source)
+        .outerjoin(Employee, Employee.id == source.c.commercial_employee_id)
+    )
+    if filter_commercial:
+        stmt = stmt.where(source.c.commercial_employee_id == filter_commercial.id)
+    # Running sums are computed over the period only
+    stmt = filter_period(stmt, source, period_from, period_to)
+    stmt = stmt.order_by(Employee.username, source.c.year, source.c.month)
+
+    print_list_objects(
+        session.execute(stmt).mappings(),
+        [
+            "commercial",
+            "year",
+            "month",
+            "contract_count",
+            "signed_count",
+            "signed_revenue",
+            "outstanding_amount",
+            "cumulative_revenue",
+        ],
+        title="Rapport mensuel par commercial",
+        headers=[
+            "Commercial",
+            "Année",
+            "Mois",
+            "Contrats",
+            "Contrats signés",
+            "CA signé",
+            "Montant dû",
+            "CA cumulé",
+        ],
+        formatters={
+            "month": "02d",
+            "signed_revenue": ".2f",
+            "outstanding_amount": ".2f",
+            "cumulative_revenue": ".2f",
+        },
+        output_format=output_format,
+    )
+
+
+@report.command(name="commercials")
+@report_options
+@authentification_required
+@specified_role_required([RoleEmployees.gestion])
+@pass_session
+def report_commercials(
+    session: Session,
+    user: Employee | None,
+    period_from: datetime | None = None,
+    period_to: datetime | None = None,
+    live: bool = False,
+    output_format: str = "table",
+):
+    """Report totals per commercial, ranked by signed revenue
+
+    Only gestion team employees can perform this action."""
+    source = report_source(session, live)
+    signed_revenue = func.sum(source.c.signed_revenue)
+    stmt = (
+        select(
+            func.rank().over(order_by=signed_revenue.desc()).label("rank"),
+            Employee.username.label("commercial"),
+            func.sum(source.c.contract_count).label("contract_count"),
+            func.sum(source.c.signed_count).label("signed_count"),
+            signed_revenue.label("signed_revenue"),
+            func.sum(source.c.outstanding_amount).label("outstanding_amount"),
+            (
+                signed_revenue * 100 / func.nullif(func.sum(signed_revenue).over(), 0)
+            ).label("revenue_share"),
+        )
+        .select_from(source)
+        .outerjoin(Employee, Employee.id == source.c.commercial_employee_id)
+        .group_by(source.c.commercial_employee_id, Employee.username)
+    )
+    stmt = filter_period(stmt, source, period_from, period_to)
+    stmt = stmt.order_by("rank", Employee.username)
+
+    print_list_objects(
+        session.execute(stmt).mappings(),
+        [
+            "rank",
+            "commercial",
+            "contract_count",
+            "signed_count",
+            "signed_revenue",
+            "outstanding_amount",
+            "revenue_share",
+        ],
+        title="Rapport par commercial",
+        headers=[
+            "Rang",
+            "Commercial",
+            "Contrats",
+            "Contrats signés",
+            "CA signé",
+            "Montant dû",
+            "Part du CA (%)",
+        ],
+        formatters={
+            "signed_revenue": ".2f",
+            "outstanding_amount": ".2f",
+            "revenue_share": ".1f",
+        },
+        output_format=output_format,
+    )
+
+
+@report.command(name="refresh")
+@authentification_required
+@specified_role_required([RoleEmployees.gestion])
+@pass_session
+def refresh_report(session: Session, user: Employee | None):
+    """Refresh the materialized view read by reports
+
+    Refreshed concurrently, so reports can still be read meanwhile.
+    Only gestion team employees can perform this action."""
+    if not has_materialized_view(session):
+        mprint(
+            "Reports are computed from contracts with this database, "
+            "there is nothing to refresh.",
+            level="warning",
+        )
+        return
+    session.execute(
+        text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {contract_monthly_report.name}")
+    )
+    mprint("Reports are refreshed.", level="confirm")
@@ -0,0 +1,63 @@
+import shlex
+
+import click
+from click.core import Context
+
+from telemetry import capture_exception
+from views.messages import print_messages as mprint
+
+try:
+    import readline  # noqa: F401 (enable line editing and history for input())
+except ImportError:
+    pass
+
+shell_group = click.Group()
+
+
+@shell_group.command()
+@click.pass_context
+def shell(ctx: Context):
+    """Run several commands in an interactive shell
+
+    Database engine, authentification and telemetry stay alive between commands,
+    each command is run in its own transaction.
+    Type "exit" or use Ctrl-D to leave."""
+    root = ctx.find_root()
+    mprint('Interactive shell. Type "--help" to list commands, "exit" to leave.')
+
+    while True:
+        try:
+            line = input("epiceventscrm> ")
+        except (EOFError, KeyboardInterrupt):
+            click.echo()
+            break
+
+        try:
+            args = shlex.split(line)
+        except ValueError as e:
+            mprint(f"Invalid command : {e}", level="warning")
+            continue
+        if not args:
+            continue
+        if args[0] in ("exit", "quit"):
+            break
+        if args[0] == ctx.info_name:
+            mprint("Already in interactive shell.", level="warning")
+            continue
+
+        try:
+            # Sub-context shares ctx.meta, so cli() opens a new transaction
+            # while cached values (like authentification) are kept
+            with root.command.make_context(
+                root.info_name, args, parent=ctx
+            ) as command_ctx:
+                root.command.invoke(command_ctx)
+        except click.exceptions.Exit:
+            pass
+        except click.ClickException as e:
+            e.show()
+        except click.Abort:
+            mprint("Aborted!", level="warning")
+        except Exception as e:
+            capture_exception(e)
+            mprint(f"Error : {e}", level="alert")
@@ -0,0 +1,167 @@
+import os
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import (
+    Column,
+    DateTime,
+    MetaData,
+    String,
+    Table,
+    case,
+    literal,
+    select,
+)
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.session import Session
+
+from controllers.auth import authentification_required
+from db import SNAPSHOT_PATH, get_snapshot_engine
+from models import Base, Client, Contract, Employee, Event, RoleEmployees
+from tools import STREAM_CHUNK_SIZE, pass_session
+from views.lists import print_list_objects
+
+sync_group = click.Group()
+
+# Changes dated up to this delay before the last synced one are read again:
+# they may have been committed later, or dated by a computer running late.
+SYNC_OVERLAP = timedelta(minutes=5)
+
+# Children are read before their parents. As rows are never deleted, every
+# parent they reference is already committed when parents are read.
+SYNCED_MODELS = [Event, Contract, Client, Employee]
+
+snapshot_metadata = MetaData()
+# Date of the last change copied from each table, only in the snapshot
+sync_state = Table(
+    "sync_state",
+    snapshot_metadata,
+    Column("table_name", String, primary_key=True),
+    Column("synced_until", DateTime, nullable=False),
+)
+
+
+def snapshot_columns(model, user: Employee) -> list:
+    """Return columns copied to the snapshot
+
+    Password hashes are never copied. Whether employees are active and their
+    authentification epoch are only copied for gestion team employees, who
+    manage employees: others get usernames and roles, as shown by events and
+    clients."""
+    columns = list(model.__table__.columns)
+    if model is Employee:
+        table = Employee.__table__
+        columns.remove(table.c.password)
+        if user.role == RoleEmployees.gestion:
+            columns.append(
+                case((Employee.password == "", ""), else_="-").label("password")
+            )
+        else:
+            columns.remove(table.c.auth_epoch)
+            columns += [
+                literal("-").label("password"),
+                literal(0).label("auth_epoch"),
+            ]
+    return columns
+
+
+def upsert(snapshot, table: Table, rows: list[dict]):
+    stmt = insert(table)
+    snapshot.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[column for column in table.primary_key],
+            set_={
+                column.name: stmt.excluded[column.name]
+                for column in table.columns
+                if not column.primary_key
+            },
+        ),
+        rows,
+    )
+
+
+@sync_group.command()
+@click.option(
+    "--full",
+    "full",
+    help="Copy every row again, instead of rows changed since last sync.",
+    is_flag=True,
+)
+@authentification_required
+@pass_session
+def sync(session: Session, user: Employee | None, full: bool = False):
+    """Copy data changed since last sync to the local snapshot
+
+    Lists and displays can then be read from the snapshot with "--snapshot"
+    option, without database round-trips. Employees are copied again each
+    time, other rows only if changed since last sync (updated_date).
+    The snapshot is updated in one transaction, an interrupted sync keeps
+    the previous one.
+    Every client, contract and event is copied, as "display-client",
+    "display-contract" and "display-event" show any of them to everyone.
+    Employees are copied as the user can see them (see snapshot_columns).
+    The snapshot file is readable by its owner only."""
+    engine = get_snapshot_engine()
+    Base.metadata.create_all(engine)
+    snapshot_metadata.create_all(engine)
+    # Not encrypted: at least, other users of the computer can't read it
+    os.chmod(SNAPSHOT_PATH, 0o600)
+
+    summary = []
+    try:
+        with engine.begin() as snapshot:
+            synced_until = (
+                {}
+                if full
+                else dict(
+                    snapshot.execute(
+                        select(sync_state.c.table_name, sync_state.c.synced_until)
+                    ).all()
+                )
+            )
+            # Parents are copied after their children, checked on commit.
+            # Set after the read above, which commits by itself with pysqlite.
+            snapshot.exec_driver_sql("PRAGMA defer_foreign_keys=ON")
+
+            for model in SYNCED_MODELS:
+                table = model.__table__
+                is_tracked = "updated_date" in table.columns
+                since = synced_until.get(table.name)
+                stmt = select(*snapshot_columns(model, user))
+                if is_tracked and since is not None:
+                    stmt = stmt.where(table.c.updated_date >= since - SYNC_OVERLAP)
+
+                count, latest = 0, since
+                result = session.execute(
+                    stmt.execution_options(yield_per=STREAM_CHUNK_SIZE)
+                ).mappings()
+                for rows in result.partitions():
+                    upsert(snapshot, table, rows)
+                    count += len(rows)
+                    if is_tracked:
+                        chunk_latest = max(row["updated_date"] for row in rows)
+                        latest = max(latest or chunk_latest, chunk_latest)
+
+                if is_tracked and latest is not None:
+                    upsert(
+                        snapshot,
+                        sync_state,
+                        [{"table_name": table.name, "synced_until": latest}],
+                    )
+                summary.append({"table": table.name, "rows": count})
+                if latest is not None:
+                    summary[-1]["synced_until"] = latest
+    except IntegrityError:
+        raise click.ClickException(
+            'Snapshot misses rows changed long ago, use "sync --full".'
+        )
+
+    print_list_objects(
+        reversed(summary),
+        ["table", "rows", "synced_until"],
+        title=f"Synchronisation de {SNAPSHOT_PATH}",
+        headers=["Table", "Lignes copiées", "Modifications jusqu'au"],
+        formatters={"synced_until": "%d/%m/%Y %H:%M:%S"},
+        epilog=f"Snapshot synced at {datetime.now():%d/%m/%Y %H:%M}.",
+    )
@@ -0,0 +1,31 @@
+import os
+
+import click
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PATH_TOKEN = os.getenv("PATH_TOKEN")
+# Time of token's last verification against database, signed with SECRET
+PATH_AUTH_CACHE = f"{PATH_TOKEN}.verified"
+
+# Keep this module free of heavy imports (database, jwt, hashing),
+# so commands which only handle the local token start fast.
+token_group = click.Group()
+
+
+@token_group.command()
+def logoff():
+    """Log you off
+
+    Delete local token created when logged in."""
+    if ctx := click.get_current_context(silent=True):
+        ctx.meta.pop("TOKEN", None)
+        ctx.meta.pop("TOKEN_PAYLOAD", None)
+    if os.path.exists(PATH_AUTH_CACHE):
+        os.remove(PATH_AUTH_CACHE)
+    if os.path.exists(PATH_TOKEN):
+        os.remove(PATH_TOKEN)
+        click.echo("Succefully logged off.")
+    else:
+        click.echo("No peristent logging detected. Nothing changed.")
@@ -6,9 +6,12 @@ import click
 from click.core import Context, Parameter
 from dotenv import load_dotenv
 from email_validator import EmailNotValidError, validate_email
+from sqlalchemy import select
 from sqlalchemy.orm.decl_api import DeclarativeAttributeIntercept
 from sqlalchemy.orm.session import Session
 
+from tools import eager_loading_options
+
 load_dotenv()
 DEBUG_MODE = os.getenv("DEBUG_MODE").lower() in ("1", "true")
 
@@ -70,6 +73,28 @@ def role_support_validation(employee) -> tuple[bool, Any | str]:
         return (False, "This employee isn't in support team.")
 
 
+MAX_IDS = 10000
+
+
+def parse_ids(value: str) -> list[int]:
+    """Parse identifiants and ranges like "12,15,40-60"
+
+    Return identifiants in given order, without duplicates, MAX_IDS at most."""
+    ids = {}
+    for part in value.split(","):
+        start, _, end = part.strip().partition("-")
+        try:
+            start, end = int(start), int(end) if end else int(start)
+        except ValueError:
+            raise ValueError(f""""{part}" isn't a valid identifiant or range.""")
+        if start > end:
+            raise ValueError(f""""{part}" isn't a valid range.""")
+        if len(ids) + end - start >= MAX_IDS:
+            raise ValueError(f"Can't target more than {MAX_IDS} objects.")
+        ids.update(dict.fromkeys(range(start, end + 1)))
+    return list(ids)
+
+
 class EnumClassParamType(click.Choice):
     """Type for click options which use an enum class"""
 
@@ -123,16 +148,36 @@ class ObjectByIDParamType(click.ParamType):
     def db_object_class(self):
         self._db_object_class = None
 
-    def __init__(self, db_object_cls):
+    def __init__(
+        self,
+        db_object_cls,
+        multiple_ids: bool = False,
+        eager_load: list[str] | None = None,
+    ):
+        """multiple_ids allows lists and ranges of identifiants like "12,15,40-60".
+        eager_load lists attributes, like "client.fullname", whose relationships
+        are loaded with targeted objects."""
         super().__init__()
         self.db_object_class = db_object_cls
+        self.multiple_ids = multiple_ids
+        self.eager_load = eager_load or []
+
+    def get_session(self, ctx: Context | None) -> Session:
+        session = ctx.meta.get("SESSION", None) if ctx else None
+        if isinstance(session, Session):
+            return session
+        raise click.ClickException("No db session provided to recover targeted object.")
 
     def convert(self, value: Any, param: Parameter | None, ctx: Context | None) -> Any:
         """Return an object of type self.db_object_class from database
 
         Can use integer identifiant to return the targeted object.
         If value is an integer, ctx.meta["Session"] must contain a sqlalchemy Session instance.
+        With multiple_ids, return a list of objects.
         """
+        if self.multiple_ids:
+            return self.convert_many(value, param, ctx)
+
         if isinstance(value, self.db_object_class):
             return value
 
@@ -148,13 +193,11 @@ class ObjectByIDParamType(click.ParamType):
         if isinstance(value, int):
             object_id = value
 
-            session = ctx.meta.get("SESSION", None)
-            if isinstance(session, Session):
-                result = session.get(self.db_object_class, object_id)
-            else:
-                raise click.ClickException(
-                    "No db session provided to recover targeted object."
-                )
+            result = self.get_session(ctx).get(
+                self.db_object_class,
+                object_id,
+                options=eager_loading_options(self.db_object_class, self.eager_load),
+            )
 
             if result is None:
                 self.fail(
@@ -165,3 +208,34 @@ class ObjectByIDParamType(click.ParamType):
             return result
 
         self.fail(f"{value} is not valid.", param, ctx)
+
+    def convert_many(
+        self, value: Any, param: Parameter | None, ctx: Context | None
+    ) -> list:
+        """Return objects targeted by a list of identifiants, with a single query"""
+        if isinstance(value, list) and all(
+            isinstance(item, self.db_object_class) for item in value
+        ):
+            return value
+
+        try:
+            ids = parse_ids(str(value))
+        except ValueError as e:
+            self.fail(str(e), param, ctx)
+
+        stmt = (
+            select(self.db_object_class)
+            .where(self.db_object_class.id.in_(ids))
+            .options(*eager_loading_options(self.db_object_class, self.eager_load))
+        )
+        objects = {obj.id: obj for obj in self.get_session(ctx).scalars(stmt)}
+
+        missing_ids = [str(object_id) for object_id in ids if object_id not in objects]
+        if missing_ids:
+            self.fail(
+                f"No {self.db_object_class.__name__} object has "
+                f"id={', '.join(missing_ids)}.",
+                param,
+                ctx,
+            )
+        return [objects[object_id] for object_id in ids]
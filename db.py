@@ -1,19 +1,53 @@
+import atexit
+import heapq
 import os
+from time import perf_counter
 
 from dotenv import load_dotenv
-from sqlalchemy import URL, create_engine
+from sqlalchemy import URL, create_engine, event, make_url
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from sql_functions import similarity
 
 load_dotenv()
 
+# Full URL like "sqlite:///crm.db", replaces the PostgreSQL settings below
+DB_URL = os.getenv("DB_URL")
 DATEBASE_NAME = os.getenv("DATEBASE_NAME")
 DB_USERNAME = os.getenv("DB_USERNAME")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 DEBUG_MODE = os.getenv("DEBUG_MODE").lower() in ("1", "true")
 DB_HOST = os.getenv("DB_HOST")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "True").lower() in ("1", "true")
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", -1))
+DB_ASYNC = os.getenv("DB_ASYNC", "False").lower() in ("1", "true")
+# Local SQLite copy made by "sync" command, read with "--snapshot" option
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "snapshot.db")
+
+_engine = None
+_session_factory = None
+_async_engine = None
+_async_session_factory = None
+_event_loop = None
+_snapshot_engine = None
+_snapshot_session_factory = None
+
+pool_stats = {"connections": 0, "connect_time": 0.0, "checkouts": 0}
+
+SLOWEST_STATEMENTS_KEPT = 5
+query_stats = {"statements": 0, "time": 0.0, "rows": 0, "slowest": []}
+
+
+# Drivers of the async engine, per backend
+ASYNC_DRIVERS = {"postgresql": "postgresql+psycopg", "sqlite": "sqlite+aiosqlite"}
 
 
 def get_db_url():
+    if DB_URL:
+        return make_url(DB_URL)
     return URL.create(
         drivername="postgresql+psycopg2",
         username=DB_USERNAME,
@@ -23,16 +57,204 @@ def get_db_url():
     )
 
 
+def get_async_db_url():
+    url = get_db_url()
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+
+
+def is_memory_database(url: URL) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def get_engine_options(url: URL) -> dict:
+    """Return pool options of the engine, according to the backend"""
+    if url.get_backend_name() != "sqlite":
+        return dict(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_pre_ping=DB_POOL_PRE_PING,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    if is_memory_database(url):
+        # Every connection would get its own empty database
+        return dict(poolclass=StaticPool, connect_args={"check_same_thread": False})
+    # Opening a file is cheap, SQLAlchemy's default pool is enough
+    return {}
+
+
+def listen_sqlite_setup(engine):
+    """Enforce foreign keys and add functions used by queries on SQLite"""
+
+    @event.listens_for(engine, "connect")
+    def setup_sqlite_connection(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+        dbapi_connection.create_function(
+            "similarity", 2, similarity, deterministic=True
+        )
+
+
+def listen_pool_stats(engine):
+    """Count new connections, time spent to open them and pool checkouts"""
+
+    @event.listens_for(engine, "do_connect")
+    def start_connect_timer(dialect, connection_record, cargs, cparams):
+        connection_record.info["connect_start"] = perf_counter()
+
+    @event.listens_for(engine, "connect")
+    def stop_connect_timer(dbapi_connection, connection_record):
+        start = connection_record.info.pop("connect_start", None)
+        pool_stats["connections"] += 1
+        if start is not None:
+            pool_stats["connect_time"] += perf_counter() - start
+
+    @event.listens_for(engine, "checkout")
+    def count_checkout(dbapi_connection, connection_record, connection_proxy):
+        pool_stats["checkouts"] += 1
+
+
+def listen_query_stats(engine):
+    """Count statements, time spent executing them and rows, keep slowest ones
+
+    COMMIT, which doesn't go through a cursor, is counted but not timed."""
+
+    @event.listens_for(engine, "commit")
+    def count_commit(conn):
+        query_stats["statements"] += 1
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+        duration = perf_counter() - conn.info["query_start"].pop()
+        query_stats["statements"] += 1
+        query_stats["time"] += duration
+        # Rows fetched or affected, when the driver knows it
+        if cursor.rowcount > 0:
+            query_stats["rows"] += cursor.rowcount
+        slowest = query_stats["slowest"]
+        if len(slowest) < SLOWEST_STATEMENTS_KEPT:
+            heapq.heappush(slowest, (duration, statement))
+        elif duration > slowest[0][0]:
+            heapq.heapreplace(slowest, (duration, statement))
+
+
+def reset_query_stats():
+    query_stats.update(statements=0, time=0.0, rows=0, slowest=[])
+
+
 def get_admin_engine():
-    url_object = get_db_url()
+    """Return the process-wide engine, created on first call"""
+    global _engine
+    if _engine is None:
+        url = get_db_url()
+        _engine = create_engine(url, echo=DEBUG_MODE, **get_engine_options(url))
+        if url.get_backend_name() == "sqlite":
+            listen_sqlite_setup(_engine)
+        listen_pool_stats(_engine)
+        listen_query_stats(_engine)
+        if is_memory_database(url):
+            # Nothing to migrate, the database lives as long as the process
+            from models import Base
 
-    return create_engine(
-        url_object,
-        echo=DEBUG_MODE,
-    )
+            Base.metadata.create_all(_engine)
+
+    return _engine
 
 
 def get_session():
-    engine = get_admin_engine()
+    global _session_factory
+    if _session_factory is None:
+        _session_factory = sessionmaker(get_admin_engine())
+
+    return _session_factory
+
+
+def get_async_engine():
+    """Return the process-wide async engine, created on first call
+
+    It uses psycopg 3 for PostgreSQL and aiosqlite for SQLite."""
+    global _async_engine
+    if _async_engine is None:
+        # Imported here so commands without concurrent reads don't pay for it
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        url = get_async_db_url()
+        _async_engine = create_async_engine(
+            url, echo=DEBUG_MODE, **get_engine_options(url)
+        )
+        if url.get_backend_name() == "sqlite":
+            listen_sqlite_setup(_async_engine.sync_engine)
+        listen_pool_stats(_async_engine.sync_engine)
+        listen_query_stats(_async_engine.sync_engine)
+
+    return _async_engine
+
+
+def get_async_session():
+    global _async_session_factory
+    if _async_session_factory is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        _async_session_factory = async_sessionmaker(get_async_engine())
+
+    return _async_session_factory
+
+
+def run_async(coroutine):
+    """Run coroutine on the process-wide event loop, created on first call
+
+    Async pooled connections belong to the loop which opened them: with one
+    loop per process, they are reused by every call (like by each command of
+    the interactive shell) and closed at exit."""
+    global _event_loop
+    if _event_loop is None:
+        import asyncio
+
+        _event_loop = asyncio.new_event_loop()
+        atexit.register(close_event_loop)
+    return _event_loop.run_until_complete(coroutine)
+
+
+def close_event_loop():
+    if _async_engine is not None:
+        _event_loop.run_until_complete(_async_engine.dispose())
+    _event_loop.close()
+
+
+def get_snapshot_engine():
+    """Return the engine of the local snapshot, created on first call"""
+    global _snapshot_engine
+    if _snapshot_engine is None:
+        _snapshot_engine = create_engine(
+            URL.create("sqlite", database=SNAPSHOT_PATH), echo=DEBUG_MODE
+        )
+        listen_sqlite_setup(_snapshot_engine)
+        listen_query_stats(_snapshot_engine)
+
+    return _snapshot_engine
+
+
+def get_snapshot_session():
+    global _snapshot_session_factory
+    if _snapshot_session_factory is None:
+        _snapshot_session_factory = sessionmaker(get_snapshot_engine())
+
+    return _snapshot_session_factory
+
+
+def get_pool_stats() -> dict:
+    """Return connection pool counters of the process-wide engine"""
+    stats = dict(pool_stats)
+    stats["pool_status"] = _engine.pool.status() if _engine is not None else None
+    return stats
+
 
-    return sessionmaker(engine)
+def get_query_stats() -> dict:
+    """Return statements counters since last reset, slowest statements first"""
+    stats = dict(query_stats)
+    stats["slowest"] = sorted(query_stats["slowest"], reverse=True)
+    return stats
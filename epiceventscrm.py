@@ -1,46 +1,258 @@
+import importlib
 import os
+from typing import NamedTuple
 
 import click
-import sentry_sdk
 from click.core import Context
 from dotenv import load_dotenv
-from sentry_sdk.integrations.atexit import AtexitIntegration
-
-from controllers import auth, client, contract, employee, event
-from db import get_session
-from tools import atexit_callback
 
 load_dotenv()
-SENTRY_DSN = os.getenv("SENTRY_DSN")
-TRACES_SAMPLE_RATE = float(os.getenv("TRACES_SAMPLE_RATE"))
-PROFILES_SAMPLE_RATE = float(os.getenv("PROFILES_SAMPLE_RATE"))
 DEBUG_MODE = os.getenv("DEBUG_MODE").lower() in ("1", "true")
 
 
-@click.group(
-    cls=click.CommandCollection,
-    sources=[
-        auth.auth_group,
-        employee.employee_group,
-        client.client_group,
-        contract.contract_group,
-        event.event_group,
-    ],
+class LazyCommand(NamedTuple):
+    """Where to find a command and how to present it before importing it
+
+    import_path is "module:group", group being the click group holding the command.
+    A light command runs without database session nor telemetry transaction.
+    A reads_only command can run on the local snapshot ("--snapshot")."""
+
+    import_path: str
+    short_help: str
+    light: bool = False
+    reads_only: bool = False
+
+
+class LazyCommandCollection(click.Group):
+    """Group which imports a command's module only when the command is invoked
+
+    Modules and their dependencies (database, hashing, jwt, Sentry...)
+    aren't imported to list commands or show help."""
+
+    def __init__(self, *args, lazy_commands: dict[str, LazyCommand], **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = lazy_commands
+
+    def list_commands(self, ctx: Context) -> list[str]:
+        return sorted(self.lazy_commands)
+
+    def get_command(self, ctx: Context, cmd_name: str) -> click.Command | None:
+        if cmd_name not in self.lazy_commands:
+            return None
+        module_name, group_name = self.lazy_commands[cmd_name].import_path.split(":")
+        group = getattr(importlib.import_module(module_name), group_name)
+        return group.get_command(ctx, cmd_name)
+
+    def format_commands(self, ctx: Context, formatter: click.HelpFormatter) -> None:
+        rows = [
+            (cmd_name, self.lazy_commands[cmd_name].short_help)
+            for cmd_name in self.list_commands(ctx)
+        ]
+        if rows:
+            with formatter.section("Commands"):
+                formatter.write_dl(rows)
+
+
+COMMANDS = {
+    "login": LazyCommand(
+        "controllers.auth:auth_group", "Use USERNAME and PASSWORD to log you in"
+    ),
+    "benchmark-hashing": LazyCommand(
+        "controllers.auth:auth_group",
+        "Measure password hashing cost profiles",
+        light=True,
+    ),
+    "logoff": LazyCommand("controllers.token:token_group", "Log you off", light=True),
+    "create-employee": LazyCommand(
+        "controllers.employee:employee_group", "Create a new employee"
+    ),
+    "update-employee": LazyCommand(
+        "controllers.employee:employee_group", "Modify an existing employee"
+    ),
+    "deactivate-employee": LazyCommand(
+        "controllers.employee:employee_group", "Deactivate an employee"
+    ),
+    "display-client": LazyCommand(
+        "controllers.client:client_group",
+        "Display any client",
+        reads_only=True,
+    ),
+    "search-clients": LazyCommand(
+        "controllers.client:client_group",
+        "Search clients, tolerating typos",
+        reads_only=True,
+    ),
+    "create-client": LazyCommand(
+        "controllers.client:client_group", "Create a new client"
+    ),
+    "update-client": LazyCommand(
+        "controllers.client:client_group", "Modify an existing client"
+    ),
+    "display-contract": LazyCommand(
+        "controllers.contract:contract_group",
+        "Display any contrat",
+        reads_only=True,
+    ),
+    "create-contract": LazyCommand(
+        "controllers.contract:contract_group", "Create a new contract"
+    ),
+    "update-contract": LazyCommand(
+        "controllers.contract:contract_group", "Modify an existing contract"
+    ),
+    "update-contracts": LazyCommand(
+        "controllers.contract:contract_group",
+        "Modify every contract matching filters",
+    ),
+    "list-contracts": LazyCommand(
+        "controllers.contract:contract_group",
+        "List details of contracts",
+        reads_only=True,
+    ),
+    "display-event": LazyCommand(
+        "controllers.event:event_group", "Display any event", reads_only=True
+    ),
+    "list-events": LazyCommand(
+        "controllers.event:event_group",
+        "List details of events",
+        reads_only=True,
+    ),
+    "add-event-support": LazyCommand(
+        "controllers.event:event_group", "Attach a support employee to an event"
+    ),
+    "auto-assign-support": LazyCommand(
+        "controllers.event:event_group",
+        "Attach support employees to every event without one",
+    ),
+    "find-available-support": LazyCommand(
+        "controllers.event:event_group",
+        "List support employees free meanwhile",
+        reads_only=True,
+    ),
+    "create-event": LazyCommand("controllers.event:event_group", "Create a new event"),
+    "update-event": LazyCommand(
+        "controllers.event:event_group", "Modify an existing event"
+    ),
+    "update-events": LazyCommand(
+        "controllers.event:event_group", "Modify every event matching filters"
+    ),
+    "dashboard": LazyCommand(
+        "controllers.dashboard:dashboard_group",
+        "Show your clients, contracts and events",
+        reads_only=True,
+    ),
+    "import": LazyCommand(
+        "controllers.bulk:bulk_group",
+        "Import clients, contracts or events from a file",
+    ),
+    "export": LazyCommand(
+        "controllers.bulk:bulk_group",
+        "Export objects to CSV, JSON lines or Parquet",
+        reads_only=True,
+    ),
+    "report": LazyCommand(
+        "controllers.report:report_group",
+        "Report revenue and receivables per commercial",
+        reads_only=True,
+    ),
+    "sync": LazyCommand(
+        "controllers.sync:sync_group", "Copy changed data to the local snapshot"
+    ),
+    "shell": LazyCommand(
+        "controllers.shell:shell_group",
+        "Run several commands in an interactive shell",
+        light=True,
+    ),
+}
+
+
+SQL_PROFILE_STATEMENT_LENGTH = 120
+
+
+def report_db_stats(transaction, profile_sql: bool = False):
+    """Attach connection pool and statements counters to the Sentry transaction
+
+    Each statement is already a span of the transaction, through Sentry's
+    SQLAlchemy integration. With profile_sql, counters are printed too.
+    Counters are dropped by the no-op transaction of commands not sampled."""
+    from db import get_pool_stats, get_query_stats
+
+    stats = get_pool_stats()
+    transaction.set_measurement("db.connections", stats["connections"])
+    transaction.set_measurement(
+        "db.connect_time", stats["connect_time"] * 1000, "millisecond"
+    )
+    transaction.set_measurement("db.pool_checkouts", stats["checkouts"])
+    if DEBUG_MODE:
+        click.echo(f"Pool stats : {stats}", err=True)
+
+    query_stats = get_query_stats()
+    transaction.set_measurement("db.statements", query_stats["statements"])
+    transaction.set_measurement("db.time", query_stats["time"] * 1000, "millisecond")
+    transaction.set_measurement("db.rows", query_stats["rows"])
+    transaction.set_data(
+        "db.slowest_statements",
+        [
+            {"duration_ms": duration * 1000, "statement": statement}
+            for duration, statement in query_stats["slowest"]
+        ],
+    )
+    if profile_sql:
+        click.echo(
+            f"SQL : {query_stats['statements']} statements, "
+            f"{query_stats['time'] * 1000:.1f} ms, {query_stats['rows']} rows",
+            err=True,
+        )
+        for duration, statement in query_stats["slowest"]:
+            statement = " ".join(statement.split())
+            if len(statement) > SQL_PROFILE_STATEMENT_LENGTH:
+                statement = statement[: SQL_PROFILE_STATEMENT_LENGTH - 3] + "..."
+            click.echo(f"{duration * 1000:9.1f} ms  {statement}", err=True)
+
+
+@click.group(cls=LazyCommandCollection, lazy_commands=COMMANDS)
+@click.option(
+    "--profile-sql",
+    "profile_sql",
+    help="Print statements count, database time, rows and slowest statements "
+    "after the command.",
+    is_flag=True,
+)
+@click.option(
+    "--snapshot",
+    "from_snapshot",
+    help='Read from the local snapshot made by "sync" instead of the database. '
+    "Only commands reading data can run.",
+    is_flag=True,
 )
 @click.pass_context
-def cli(ctx: Context):
-    if not DEBUG_MODE:
-        sentry_sdk.init(
-            dsn=SENTRY_DSN,
-            traces_sample_rate=TRACES_SAMPLE_RATE,
-            profiles_sample_rate=PROFILES_SAMPLE_RATE,
-            debug=DEBUG_MODE,
-            integrations=[AtexitIntegration(callback=atexit_callback)],
+def cli(ctx: Context, profile_sql: bool = False, from_snapshot: bool = False):
+    command = COMMANDS[ctx.invoked_subcommand]
+    if command.light:
+        return
+    if from_snapshot and not command.reads_only:
+        raise click.UsageError(
+            f"{ctx.invoked_subcommand} can't run on the snapshot, it isn't read-only."
         )
-    ctx.meta["SESSION"] = ctx.with_resource(get_session().begin())
+
+    # Imported here so help and light commands don't pay for them
+    import telemetry
+    from db import SNAPSHOT_PATH, get_session, get_snapshot_session, reset_query_stats
+
+    telemetry.install_excepthook()
+    # Counted per command, as the interactive shell runs several ones
+    reset_query_stats()
+    if from_snapshot and not os.path.exists(SNAPSHOT_PATH):
+        raise click.UsageError('There is no snapshot yet, use "sync" command.')
+
+    # Resources are closed in reverse order: the session commits first, so
+    # its statements (flush, COMMIT) are counted, then stats are reported
+    # while the Sentry transaction is still open.
     ctx.meta["SENTRY"] = ctx.with_resource(
-        sentry_sdk.start_transaction(name=ctx.invoked_subcommand)
+        telemetry.start_transaction(ctx.invoked_subcommand)
     )
+    ctx.call_on_close(lambda: report_db_stats(ctx.meta["SENTRY"], profile_sql))
+    session_factory = get_snapshot_session() if from_snapshot else get_session()
+    ctx.meta["SESSION"] = ctx.with_resource(session_factory.begin())
 
 
 if __name__ == "__main__":
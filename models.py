@@ -1,12 +1,25 @@
 import enum
 from dataclasses import dataclass
-
-from sqlalchemy import Column, DateTime, Enum, ForeignKey, Integer, String, Float
-from sqlalchemy.ext.hybrid import hybrid_property
+from datetime import datetime
+
+from sqlalchemy import (
+    CheckConstraint,
+    Column,
+    DateTime,
+    Enum,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    text,
+)
+from sqlalchemy.ext.hybrid import hybrid_method, hybrid_property
 from sqlalchemy.orm import relationship, validates
 from sqlalchemy.orm.decl_api import DeclarativeBase
 
 from data_validation import email_validation, username_validation
+from sql_functions import periods_overlap
 
 
 class MergingMixin(object):
@@ -34,6 +47,8 @@ class Employee(Base, MergingMixin):
     username = Column(String(70), unique=True, nullable=False)
     password = Column(String, nullable=False)
     role = Column(Enum(RoleEmployees))
+    # Incremented to revoke tokens delivered before a change
+    auth_epoch = Column(Integer, nullable=False, default=0, server_default="0")
 
     @validates("username")
     def validate_username(self, key, value):
@@ -47,6 +62,22 @@ class Employee(Base, MergingMixin):
 @dataclass
 class Client(Base, MergingMixin):
     __tablename__ = "client"
+    __table_args__ = (
+        Index("ix_client_commercial_employee_id", "commercial_employee_id"),
+        # For rows changed since last sync
+        Index("ix_client_updated_date", "updated_date"),
+        # Trigram indexes for search-clients (pg_trgm extension)
+        *(
+            Index(
+                f"ix_client_{name}_trgm",
+                name,
+                postgresql_using="gin",
+                postgresql_ops={name: "gin_trgm_ops"},
+            ).ddl_if(dialect="postgresql")
+            for name in ("firstname", "lastname", "society_name", "email")
+        ),
+    )
+
     id = Column(Integer, primary_key=True)
     firstname = Column(String(70))
     lastname = Column(String(70), nullable=False)
@@ -92,6 +123,17 @@ class ContractStatus(enum.Enum):
 @dataclass
 class Contract(Base, MergingMixin):
     __tablename__ = "contract"
+    __table_args__ = (
+        Index("ix_contract_client_id", "client_id"),
+        Index("ix_contract_created_date", "created_date"),
+        Index(
+            "ix_contract_not_signed_created_date",
+            "created_date",
+            postgresql_where=text("status != 'signed'"),
+        ),
+        Index("ix_contract_updated_date", "updated_date"),
+    )
+
     id = Column(Integer, primary_key=True)
     client_id = Column(
         Integer, ForeignKey("client.id", ondelete="restrict"), nullable=False
@@ -101,6 +143,10 @@ class Contract(Base, MergingMixin):
     amount_to_pay = Column(Float)
     created_date = Column(DateTime, nullable=False)
     status = Column(Enum(ContractStatus))
+    # Change tracking, for "sync" command
+    updated_date = Column(
+        DateTime, nullable=False, default=datetime.now, onupdate=datetime.now
+    )
     # indirect commercial_employee (= client.commercial_employee)
     associated_event = relationship("Event", back_populates="contract", uselist=False)
 
@@ -110,6 +156,30 @@ class Contract(Base, MergingMixin):
 @dataclass
 class Event(Base, MergingMixin):
     __tablename__ = "event"
+    __table_args__ = (
+        Index("ix_event_contrat_id", "contrat_id"),
+        Index("ix_event_support_employee_id", "support_employee_id"),
+        Index(
+            "ix_event_no_support_id",
+            "id",
+            postgresql_where=text("support_employee_id IS NULL"),
+        ),
+        # tsrange() fails when its upper bound is lower
+        CheckConstraint("datetime_end >= datetime_start", name="ck_event_period"),
+        # For overlapping events of a support employee (btree_gist extension)
+        Index(
+            "ix_event_support_period",
+            "support_employee_id",
+            text("tsrange(datetime_start, datetime_end)"),
+            postgresql_using="gist",
+            postgresql_where=text(
+                "support_employee_id IS NOT NULL"
+                " AND datetime_start IS NOT NULL AND datetime_end IS NOT NULL"
+            ),
+        ).ddl_if(dialect="postgresql"),
+        Index("ix_event_updated_date", "updated_date"),
+    )
+
     id = Column(Integer, primary_key=True)
     contrat_id = Column(
         Integer, ForeignKey("contract.id", ondelete="restrict"), nullable=False
@@ -128,4 +198,32 @@ class Event(Base, MergingMixin):
     )  # TODO Validate that employee is a support
     attendees = Column(Integer)
     notes = Column(String)
+    # Change tracking, for "sync" command
+    updated_date = Column(
+        DateTime, nullable=False, default=datetime.now, onupdate=datetime.now
+    )
+
+    @hybrid_method
+    def overlaps(self, datetime_start: datetime, datetime_end: datetime):
+        """Whether event's period overlaps the other, ends being excluded
+
+        Like periods_overlap, periods empty or with a missing bound never do."""
+        bounds = (self.datetime_start, self.datetime_end, datetime_start, datetime_end)
+        if any(bound is None for bound in bounds):
+            return False
+        return (
+            self.datetime_start < self.datetime_end
+            and datetime_start < datetime_end
+            and self.datetime_start < datetime_end
+            and datetime_start < self.datetime_end
+        )
+
+    @overlaps.expression
+    def overlaps(cls, datetime_start, datetime_end):
+        # On PostgreSQL, same expression as ix_event_support_period so the
+        # index is used
+        return periods_overlap(
+            cls.datetime_start, cls.datetime_end, datetime_start, datetime_end
+        )
+
     # indirect client (=contract.client)
@@ -0,0 +1,105 @@
+"""SQL expressions compiled according to the database backend
+
+PostgreSQL gets its own operators (ranges, pg_trgm) so its indexes are used,
+other backends (SQLite) get portable equivalents."""
+import re
+
+from sqlalchemy import Boolean, Float
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+# Default of pg_trgm.similarity_threshold
+TRIGRAM_THRESHOLD = 0.3
+
+
+class periods_overlap(FunctionElement):
+    """Whether [start_1, end_1) and [start_2, end_2) overlap
+
+    As with PostgreSQL's ranges, an empty period overlaps nothing. A period
+    with a missing bound overlaps nothing either, on every backend."""
+
+    type = Boolean()
+    name = "periods_overlap"
+    inherit_cache = True
+
+
+def known_bounds(bounds) -> str:
+    return " AND ".join(f"{bound} IS NOT NULL" for bound in bounds)
+
+
+@compiles(periods_overlap)
+def compile_periods_overlap(element, compiler, **kw):
+    bounds = [compiler.process(clause, **kw) for clause in element.clauses]
+    start_1, end_1, start_2, end_2 = bounds
+    return (
+        f"({known_bounds(bounds)} AND {start_1} < {end_1} AND {start_2} < {end_2}"
+        f" AND {start_1} < {end_2} AND {start_2} < {end_1})"
+    )
+
+
+@compiles(periods_overlap, "postgresql")
+def compile_periods_overlap_postgresql(element, compiler, **kw):
+    bounds = [compiler.process(clause, **kw) for clause in element.clauses]
+    start_1, end_1, start_2, end_2 = bounds
+    # Bounds checked first, so the partial ix_event_support_period is used
+    return (
+        f"({known_bounds(bounds)}"
+        f" AND tsrange({start_1}, {end_1}) && tsrange({start_2}, {end_2}))"
+    )
+
+
+class trigram_match(FunctionElement):
+    """Whether text is similar enough to query, by trigrams"""
+
+    type = Boolean()
+    name = "trigram_match"
+    inherit_cache = True
+
+
+@compiles(trigram_match)
+def compile_trigram_match(element, compiler, **kw):
+    text, query = (compiler.process(clause, **kw) for clause in element.clauses)
+    return f"similarity({text}, {query}) >= {TRIGRAM_THRESHOLD}"
+
+
+@compiles(trigram_match, "postgresql")
+def compile_trigram_match_postgresql(element, compiler, **kw):
+    text, query = element.clauses
+    # Operator using trigram indexes, escaped by the compiler as needed
+    return compiler.process(text.op("%")(query), **kw)
+
+
+class greatest(FunctionElement):
+    type = Float()
+    name = "greatest"
+    inherit_cache = True
+
+
+@compiles(greatest)
+def compile_greatest(element, compiler, **kw):
+    return f"greatest({compiler.process(element.clauses, **kw)})"
+
+
+@compiles(greatest, "sqlite")
+def compile_greatest_sqlite(element, compiler, **kw):
+    # SQLite's max() with several arguments is a scalar function
+    return f"max({compiler.process(element.clauses, **kw)})"
+
+
+def trigrams(text: str) -> set[str]:
+    """Trigrams of text's words, as pg_trgm extracts them"""
+    result = set()
+    for word in re.findall(r"\w+", text.lower()):
+        padded = f"  {word} "
+        result.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def similarity(text: str | None, query: str | None) -> float:
+    """pg_trgm's similarity(), registered as a function on SQLite connections"""
+    if text is None or query is None:
+        return 0.0
+    text_trigrams, query_trigrams = trigrams(text), trigrams(query)
+    if not text_trigrams or not query_trigrams:
+        return 0.0
+    return len(text_trigrams & query_trigrams) / len(text_trigrams | query_trigrams)
@@ -0,0 +1,103 @@
+"""Sentry telemetry, paid for only by commands which send something
+
+Transactions are sampled here, before Sentry is even imported: a command
+which isn't sampled gets a no-op transaction and Sentry stays uninitialized.
+Sentry is initialized on first sampled transaction or first error. Its
+transport already sends events from a background thread, batched in its
+queue, so only the flush at exit may wait, and only when something was sent.
+"""
+import os
+import random
+import sys
+
+from dotenv import load_dotenv
+
+load_dotenv()
+SENTRY_DSN = os.getenv("SENTRY_DSN")
+TRACES_SAMPLE_RATE = float(os.getenv("TRACES_SAMPLE_RATE"))
+PROFILES_SAMPLE_RATE = float(os.getenv("PROFILES_SAMPLE_RATE"))
+# Longest wait at exit for queued events to be sent, in seconds
+SHUTDOWN_TIMEOUT = float(os.getenv("SENTRY_SHUTDOWN_TIMEOUT", "2"))
+DEBUG_MODE = os.getenv("DEBUG_MODE").lower() in ("1", "true")
+
+ENABLED = bool(SENTRY_DSN) and not DEBUG_MODE
+
+_sentry = None
+# Set before Sentry is initialized, given to it when it is
+_user = None
+
+
+class NoOpTransaction:
+    """Stands for a Sentry transaction which isn't sampled"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set_measurement(self, name, value, unit=""):
+        pass
+
+    def set_data(self, key, value):
+        pass
+
+
+NO_OP_TRANSACTION = NoOpTransaction()
+
+
+def get_sentry():
+    """Return sentry_sdk, initialized on first call"""
+    global _sentry
+    if _sentry is None:
+        import sentry_sdk
+        from sentry_sdk.integrations.atexit import AtexitIntegration
+
+        from tools import atexit_callback
+
+        sentry_sdk.init(
+            dsn=SENTRY_DSN,
+            # Transactions reaching Sentry are already sampled, see start_transaction
+            traces_sample_rate=1.0,
+            profiles_sample_rate=PROFILES_SAMPLE_RATE,
+            shutdown_timeout=SHUTDOWN_TIMEOUT,
+            integrations=[AtexitIntegration(callback=atexit_callback)],
+        )
+        if _user is not None:
+            sentry_sdk.set_user(_user)
+        _sentry = sentry_sdk
+    return _sentry
+
+
+def start_transaction(name: str):
+    """Return a Sentry transaction if sampled, else a no-op one"""
+    if not ENABLED or random.random() >= TRACES_SAMPLE_RATE:
+        return NO_OP_TRANSACTION
+    return get_sentry().start_transaction(name=name)
+
+
+def set_user(user: dict):
+    global _user
+    _user = user
+    if _sentry is not None:
+        _sentry.set_user(user)
+
+
+def capture_exception(exception: BaseException):
+    if ENABLED:
+        get_sentry().capture_exception(exception)
+
+
+def install_excepthook():
+    """Send uncaught exceptions, as Sentry's own hook does once initialized"""
+    previous_hook = sys.excepthook
+
+    def excepthook(exc_type, exc_value, exc_traceback):
+        # Sentry's hook, installed meanwhile, sends it already
+        if _sentry is None:
+            capture_exception(exc_value)
+        previous_hook(exc_type, exc_value, exc_traceback)
+
+    if ENABLED and not getattr(sys.excepthook, "is_telemetry_hook", False):
+        excepthook.is_telemetry_hook = True
+        sys.excepthook = excepthook
@@ -0,0 +1,23 @@
+"""Settings of the test suite, set before any project module reads them
+
+Commands run on an in-memory SQLite database, created with the engine."""
+import os
+import tempfile
+
+os.environ.update(
+    DB_URL="sqlite://",
+    PATH_TOKEN=os.path.join(tempfile.mkdtemp(), "token.txt"),
+    SECRET="test secret, long enough for HMAC-SHA256 keys",
+    TOKEN_VALIDITY_HOURS="1",
+    AUTH_CACHE_SECONDS="0",
+    DEBUG_MODE="False",
+    DB_ASYNC="False",
+    SENTRY_DSN="",
+    TRACES_SAMPLE_RATE="0",
+    PROFILES_SAMPLE_RATE="0",
+    # Cheapest Argon2 profile, tests don't need slow hashing
+    ARGON2_TIME_COST="1",
+    ARGON2_MEMORY_COST="8",
+    ARGON2_PARALLELISM="1",
+)
+os.environ.setdefault("DEFAULT_VERBOSITY", "3")
@@ -0,0 +1,49 @@
+"""Statements run by list commands don't depend on the number of rows"""
+import pytest
+from click.testing import CliRunner
+from sqlalchemy import event
+
+from benchmark_commands import PASSWORD, seed
+from db import get_admin_engine
+from epiceventscrm import cli
+
+SCALE = 50
+
+
+def count_statements(args: list[str]) -> tuple[int, int]:
+    """Invoke the CLI, return the number of statements it ran and output lines"""
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = get_admin_engine()
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        result = CliRunner().invoke(cli, args)
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    assert result.exit_code == 0, result.output
+    return len(statements), result.output.count("\n")
+
+
+@pytest.mark.parametrize(
+    "username, command",
+    [
+        ("commercial1", ["list-contracts"]),
+        ("commercial1", ["list-contracts", "--not-signed"]),
+        ("gestion1", ["list-events"]),
+        ("gestion1", ["list-events", "--no-support"]),
+    ],
+)
+def test_statements_count_is_constant(username: str, command: list[str]):
+    counts, lines = [], []
+    for scale in (SCALE, 10 * SCALE):
+        seed(scale)
+        CliRunner().invoke(cli, ["login", username, PASSWORD])
+        statements, output_lines = count_statements(command)
+        counts.append(statements)
+        lines.append(output_lines)
+
+    assert lines[1] > lines[0]
+    assert counts[0] == counts[1]
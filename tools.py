@@ -1,4 +1,14 @@
+import asyncio
+from operator import attrgetter
+from typing import Iterable, Iterator, NamedTuple
+
 import click
+from sqlalchemy import Select, func, inspect, select
+from sqlalchemy.orm import aliased, joinedload, selectinload
+from sqlalchemy.orm.interfaces import MANYTOONE
+from sqlalchemy.orm.session import Session
+
+from views.lists import OUTPUT_FORMATS
 
 pass_session = click.decorators.pass_meta_key(key="SESSION", doc_description="")
 
@@ -7,3 +17,235 @@ def atexit_callback(pending, timout):
     """Method which do nothing to overide default callback.
     Default method write in stderr and interfere with cli actions."""
     pass
+
+
+def eager_loading_options(model, list_attr: list[str]) -> list:
+    """Return loader options for relationships reached by dotted attributes
+
+    Each relationship used in a path like "client.fullname" is loaded with the
+    main query (many-to-one, joined) or with one batched "IN" query per
+    relationship (others), so the number of statements doesn't grow with rows.
+    """
+    options = {}
+    for attr in list_attr:
+        mapper = inspect(model)
+        path = ()
+        loader = None
+        for name in attr.split(".")[:-1]:
+            relationship = mapper.relationships.get(name)
+            if relationship is None or relationship.direction is not MANYTOONE:
+                break
+            path += (name,)
+            strategy = (
+                joinedload if relationship.direction is MANYTOONE else selectinload
+            )
+            loader = (
+                strategy(relationship.class_attribute)
+                if loader is None
+                else getattr(loader, strategy.__name__)(relationship.class_attribute)
+            )
+            options.setdefault(path, loader)
+            mapper = relationship.mapper
+    return list(options.values())
+
+
+class Projection(NamedTuple):
+    """Select of the columns needed to render dotted attributes, see project"""
+
+    stmt: Select
+    list_attr: list[str]
+    # Attribute path read in Python on the fetched value, like "name" of an enum
+    remainders: list[str | None]
+    # Whether the value is reached through an outer joined relationship
+    through_relationship: list[bool]
+
+    def rows(self, result: Iterable) -> Iterator[dict]:
+        """Turn fetched rows into dicts keyed by dotted attributes
+
+        A value missing because a relationship is empty has no key."""
+        for row in result:
+            values = {}
+            for attr, value, remainder, through_relationship in zip(
+                self.list_attr, row, self.remainders, self.through_relationship
+            ):
+                if value is None and (through_relationship or remainder):
+                    continue
+                values[attr] = (
+                    value if remainder is None else attrgetter(remainder)(value)
+                )
+            yield values
+
+
+def project(model, list_attr: list[str]) -> Projection:
+    """Compile dotted attributes into a single select of their columns
+
+    Many-to-one relationships in paths like "client.fullname" are outer
+    joined once each, so rows are plain tuples and no ORM object is built.
+    Other relationships, like "associated_event.id", would repeat rows if
+    joined: the rest of their path is read from their first object by a
+    correlated subquery. Path parts after the last mapped attribute (like
+    "name" in "status.name") are read in Python.
+    """
+    joined = {}
+    columns = []
+    remainders = []
+    through_relationship = []
+    for attr in list_attr:
+        entity = model
+        mapper = inspect(model)
+        path = ()
+        names = attr.split(".")
+        for index, name in enumerate(names):
+            relationship = mapper.relationships.get(name)
+            if relationship is None or relationship.direction is not MANYTOONE:
+                break
+            path += (name,)
+            if path not in joined:
+                joined[path] = (
+                    aliased(relationship.mapper.class_),
+                    getattr(entity, name),
+                )
+            entity = joined[path][0]
+            mapper = relationship.mapper
+        else:
+            raise ValueError(f"{attr} doesn't end with a column")
+
+        remainder = names[index + 1 :]
+        if relationship is None:
+            column = getattr(entity, name)
+            remainders.append(".".join(remainder) if remainder else None)
+        else:
+            if not remainder:
+                raise ValueError(f"{attr} doesn't end with a column")
+            related = project(relationship.mapper.class_, [".".join(remainder)])
+            column = (
+                related.stmt.where(getattr(entity, name).expression)
+                .order_by(*relationship.mapper.primary_key)
+                .limit(1)
+                .scalar_subquery()
+            )
+            remainders.append(related.remainders[0])
+        columns.append(column.label(attr))
+        through_relationship.append(bool(path) or relationship is not None)
+
+    stmt = select(*columns).select_from(model)
+    for target, relationship_attr in joined.values():
+        stmt = stmt.outerjoin(relationship_attr.of_type(target))
+    return Projection(stmt, list_attr, remainders, through_relationship)
+
+
+STREAM_CHUNK_SIZE = 1000
+
+
+def format_option(function):
+    """Add the output format option to a list or display command"""
+    return click.option(
+        "--format",
+        "output_format",
+        help="Output as a table, or as data for other tools.",
+        type=click.Choice(OUTPUT_FORMATS),
+        default="table",
+        show_default=True,
+    )(function)
+
+
+def list_options(function):
+    """Add keyset pagination and streaming options to a list command"""
+    function = click.option(
+        "--stream",
+        "stream",
+        help="Fetch rows with a server-side cursor and print them by chunks.",
+        is_flag=True,
+    )(function)
+    function = click.option(
+        "--after-id",
+        "after_id",
+        help="Only list objects with an identifiant greater than this one.",
+        type=click.IntRange(min=0),
+    )(function)
+    function = click.option(
+        "--page-size",
+        "page_size",
+        help="Maximum number of objects to list.",
+        type=click.IntRange(min=1),
+    )(function)
+    return function
+
+
+BULK_PREVIEW_SIZE = 20
+
+
+def dry_run_option(function):
+    """Add an option to preview a bulk update command without updating"""
+    return click.option(
+        "--dry-run",
+        "dry_run",
+        help="Count objects which would be updated and show the first "
+        f"{BULK_PREVIEW_SIZE}, without updating them.",
+        is_flag=True,
+    )(function)
+
+
+def count_rows(session: Session, stmt: Select) -> int:
+    return session.scalar(
+        select(func.count()).select_from(stmt.order_by(None).subquery())
+    )
+
+
+def fetch_list(
+    session: Session,
+    stmt: Select,
+    model,
+    page_size: int | None = None,
+    after_id: int | None = None,
+    stream: bool = False,
+):
+    """Execute a list statement, ordered by id, with keyset pagination
+
+    The statement selects columns (see project), rows are returned as tuples.
+    With stream, rows are fetched through a server-side cursor by chunks of
+    STREAM_CHUNK_SIZE and an iterable result is returned instead of a list."""
+    stmt = stmt.order_by(model.id)
+    if after_id is not None:
+        stmt = stmt.where(model.id > after_id)
+    if page_size is not None:
+        stmt = stmt.limit(page_size)
+
+    if stream:
+        return session.execute(stmt.execution_options(yield_per=STREAM_CHUNK_SIZE))
+    return session.execute(stmt).all()
+
+
+async def gather_reads(stmts: list[Select]) -> list[list]:
+    """Execute statements concurrently, each on its own async session"""
+    from db import get_async_engine, get_async_session
+
+    async def fetch(stmt: Select) -> list:
+        async with get_async_session()() as async_session:
+            return (await async_session.execute(stmt)).all()
+
+    engine = get_async_engine()
+    if engine.dialect.server_version_info is None:
+        # First connection initializes the dialect, which concurrent first
+        # connections would wait for in a deadlock
+        async with engine.connect():
+            pass
+    return await asyncio.gather(*(fetch(stmt) for stmt in stmts))
+
+
+def fetch_concurrently(session: Session, *stmts: Select) -> list[list]:
+    """Execute independent read statements and return their rows
+
+    With DB_ASYNC setting, they are executed concurrently through the async
+    engine, whose pool is kept for the process. Otherwise they're executed one after the other with session, as
+    for an in-memory SQLite database which an async engine wouldn't share, or
+    the local snapshot."""
+    import db
+
+    if (
+        not db.DB_ASYNC
+        or session.get_bind() is not db.get_admin_engine()
+        or db.is_memory_database(db.get_db_url())
+    ):
+        return [session.execute(stmt).all() for stmt in stmts]
+    return db.run_async(gather_reads(list(stmts)))
@@ -1,16 +1,30 @@
-from operator import attrgetter
+import csv
+import enum
+import io
+import json
+from collections.abc import Mapping
+from itertools import chain, islice
+from operator import attrgetter, itemgetter
 
-from click import secho
+from click import echo, secho
 from prettytable import PrettyTable
+from sqlalchemy import inspect
 
 from views.messages import print_messages
 
 
+def get_attr_value(object, attr: str):
+    """Read a dotted attribute from an object, or a row projected by attribute"""
+    if isinstance(object, Mapping):
+        return object[attr]
+    return attrgetter(attr)(object)
+
+
 def get_attr_as_str(object, attr: str, formatter: str | None = None):
     formatter = formatter if formatter is not None else ""
     try:
-        return format(attrgetter(attr)(object), formatter)
-    except AttributeError:
+        return format(get_attr_value(object, attr), formatter)
+    except (AttributeError, KeyError):
         return ""
 
 
@@ -22,6 +36,51 @@ def get_generic_table():
     )
 
 
+RENDER_BATCH_SIZE = 1000
+OUTPUT_FORMATS = ["table", "csv", "json", "ndjson"]
+
+
+def to_json_value(value):
+    # By name, as in table output and exports
+    if isinstance(value, enum.Enum):
+        return value.name
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def get_column_getters(
+    obj, list_attr: list[str], formatters: dict[str, str], as_text: bool = True
+):
+    """Return a function per attribute giving the cell text of an object
+
+    Getters and format specs are resolved once for all rows, according to the
+    kind of the first object (ORM object or row projected by attribute).
+    Without as_text, unformatted values are kept as JSON values. A NULL value
+    of a formatted column is empty (None without as_text)."""
+
+    def column_getter(attr: str):
+        get_value = itemgetter(attr) if isinstance(obj, Mapping) else attrgetter(attr)
+        formatter = formatters.get(attr)
+        missing = "" if as_text else None
+        to_str = (
+            # A format spec like ".2f" fails on a NULL value
+            (lambda value: missing if value is None else format(value, formatter))
+            if formatter
+            else (str if as_text else to_json_value)
+        )
+
+        def get_cell(obj):
+            try:
+                return to_str(get_value(obj))
+            except (AttributeError, KeyError):
+                return missing
+
+        return get_cell
+
+    return [column_getter(attr) for attr in list_attr]
+
+
 def print_list_objects(
     objects,
     list_attr: list[str],
@@ -29,30 +88,131 @@ def print_list_objects(
     headers: list[str] = None,
     title: str = None,
     epilog: str = None,
+    chunk_size: int = None,
+    output_format: str = "table",
 ):
-    """Print in stdout a table with asked attributes from objects."""
-    if objects is None or len(objects) == 0:
+    """Print in stdout a table with asked attributes from objects.
+
+    Other output formats are written by print_list_data, see it.
+    Column widths are computed on a sample: the first chunk_size objects, or all
+    of them without chunk_size. Then rows are written by batches, so objects can
+    be any iterable (like a streamed result) and are never held in memory.
+    A cell of a later row wider than its column overflows on its row only."""
+    if output_format != "table":
+        print_list_data(objects, list_attr, formatters, output_format)
+        if epilog:
+            secho(epilog, err=True)
+        return
+
+    iterator = iter(objects if objects is not None else [])
+    sample = list(islice(iterator, chunk_size))
+    if len(sample) == 0:
         print_messages("List is empty", level="warning")
         return
 
-    table = get_generic_table()
+    if not headers or len(headers) != len(list_attr):
+        headers = list_attr
+    # Same header style as PrettyTable's "cap" used for other tables
+    headers = [header.capitalize() for header in headers]
+    getters = get_column_getters(sample[0], list_attr, formatters)
+    sample_rows = [[get_cell(obj) for get_cell in getters] for obj in sample]
+    widths = [
+        max(len(header), *(len(row[index]) for row in sample_rows))
+        for index, header in enumerate(headers)
+    ]
+    # Like PrettyTable, columns are widened to fit a longer title
+    missing_width = len(title or "") + 2 - (sum(widths) + 3 * len(widths) - 1)
+    if missing_width > 0:
+        for index in range(len(widths)):
+            widths[index] += missing_width // len(widths) + (
+                index < missing_width % len(widths)
+            )
+
+    def format_line(cells) -> str:
+        return (
+            "|"
+            + "|".join(f" {cell.center(width)} " for cell, width in zip(cells, widths))
+            + "|"
+        )
+
+    separator = " " + " ".join("–" * (width + 2) for width in widths) + " "
+    lines = []
     if title:
-        table.title = title
-    if headers and len(headers) == len(list_attr):
-        table.field_names = headers
-    for obj in objects:
-        table.add_row(
-            [
-                get_attr_as_str(obj, attr, formatters.get(attr, None))
-                for attr in list_attr
-            ]
+        inner_width = len(separator) - 2
+        lines += [" " + "–" * inner_width + " ", "|" + title.center(inner_width) + "|"]
+    lines += [separator, format_line(headers), separator]
+    lines += [format_line(row) for row in sample_rows]
+    echo("\n".join(lines))
+
+    while batch := list(islice(iterator, RENDER_BATCH_SIZE)):
+        echo(
+            "\n".join(
+                format_line([get_cell(obj) for get_cell in getters]) for obj in batch
+            )
         )
-    secho(table.get_string())
+    echo(separator)
 
     if epilog:
         secho(epilog)
 
 
+def print_list_data(
+    objects, list_attr: list[str], formatters: dict[str, str], output_format: str
+):
+    """Print objects as CSV, a JSON list or JSON lines (ndjson)
+
+    Keys are the attribute names. Rows are written by batches as objects are
+    iterated, and one by one for ndjson, so a reader can process them at once.
+    """
+    iterator = iter(objects if objects is not None else [])
+    first = next(iterator, None)
+    if first is None:
+        if output_format == "csv":
+            echo(",".join(list_attr))
+        elif output_format == "json":
+            echo("[]")
+        return
+
+    iterator = chain([first], iterator)
+    # csv writes None as an empty field
+    getters = get_column_getters(first, list_attr, formatters, as_text=False)
+
+    if output_format == "ndjson":
+        for obj in iterator:
+            echo(
+                json.dumps(
+                    {attr: get_cell(obj) for attr, get_cell in zip(list_attr, getters)}
+                )
+            )
+        return
+
+    if output_format == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(list_attr)
+        while batch := list(islice(iterator, RENDER_BATCH_SIZE)):
+            writer.writerows([get_cell(obj) for get_cell in getters] for obj in batch)
+            echo(buffer.getvalue(), nl=False)
+            buffer.seek(0)
+            buffer.truncate()
+        return
+
+    separator = "["
+    while batch := list(islice(iterator, RENDER_BATCH_SIZE)):
+        echo(
+            separator
+            + ",\n".join(
+                json.dumps(
+                    {attr: get_cell(obj) for attr, get_cell in zip(list_attr, getters)}
+                )
+                for obj in batch
+            ),
+            nl=False,
+        )
+        separator = ",\n"
+    echo("]")
+
+
 def print_object_details(instance):
     table = get_generic_table()
     table.field_names = ["Name", "Value"]
@@ -63,3 +223,19 @@ def print_object_details(instance):
         table.add_row([attr, get_attr_as_str(instance, attr)])
 
     secho(table.get_string())
+
+
+def print_objects_details(instances: list, output_format: str = "table"):
+    """Print details of one object, or a table with a row per object."""
+    if len(instances) == 1 and output_format == "table":
+        print_object_details(instances[0])
+        return
+
+    list_attr = [attr.key for attr in inspect(instances[0]).mapper.column_attrs]
+    print_list_objects(
+        instances,
+        list_attr,
+        formatters={},
+        headers=list_attr,
+        output_format=output_format,
+    )